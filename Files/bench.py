@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+This file holds the benchmarks for the shell. Each benchmark generates its own
+test data in a temporary directory, times the shell commands on it and prints
+the results, so the numbers can be compared before and after a change.
+
+usage: python bench.py <benchmark> [size in MB]
+"""
+import os
+import sys
+import random
+import struct
+import tempfile
+import multiprocessing
+from time import perf_counter, sleep
+
+import shell
+
+'''
+make_log:
+writes a log-like text file of roughly the given size
+'''
+def make_log(path, size_mb):
+    '''
+    writes a log-like text file of about size_mb megabytes, so every benchmark
+    searches and counts through the same kind of data.
+    '''
+    levels = ["INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR"]
+    words = ["request", "user", "cache", "disk", "timeout", "bacon", "session", "retry"]
+    rng = random.Random(5143)
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            chunk = []
+            for i in range(10000):
+                level = rng.choice(levels)
+                text = " ".join(rng.choice(words) for _ in range(8))
+                chunk.append(f"2025-09-{i % 28 + 1:02} {level} id={rng.randrange(10**6)} {text}\n")
+            data = "".join(chunk)
+            f.write(data)
+            written += len(data)
+    return path
+
+'''
+timed:
+runs a function and returns how long it took and what it returned
+'''
+def timed(func, *args):
+    '''
+    returns (seconds, result) for a single call of func.
+    '''
+    start = perf_counter()
+    result = func(*args)
+    return perf_counter() - start, result
+
+'''
+paged_source:
+feeds a fifo a block at a time, like a slow network stream
+'''
+def paged_source(fifo, path, block_size, delay):
+    '''
+    copies the file at path into the fifo one block at a time. the next block
+    is only fetched (which takes delay seconds) once the reader has taken
+    all of the last one out of the pipe, like a stream that pages its data in
+    over the network, so the stage reading the fifo really waits on it.
+    meant to run in its own process, so it doesn't take the GIL from the
+    pipeline it feeds.
+    '''
+    import fcntl, termios
+    with open(path, "rb") as source, open(fifo, "wb") as f:
+        for block in iter(lambda: source.read(block_size), b""):
+            f.write(block)
+            f.flush()
+            # waits until the pipe is empty again
+            while struct.unpack("i", fcntl.ioctl(f, termios.FIONREAD, b"\0\0\0\0"))[0]:
+                sleep(0.001)
+            sleep(delay)
+
+'''
+bench_pipeline:
+compares the serial and the threaded pipeline
+'''
+def bench_pipeline(size_mb=64):
+    '''
+    times a few multi-stage pipelines in the serial (generator) mode and in the
+    threaded mode, where every stage runs in its own thread. the first ones
+    read a file in the page cache, so every stage only needs the CPU, and
+    under the GIL the threads just take turns (threaded mode is slower). the
+    last ones read the same log from a fifo fed by paged_source, where cat
+    waits on every block; in threaded mode the grep stages go on with the
+    lines they already have in the meantime, so it wins when they have
+    enough work to do.
+    '''
+    def compare(line, name, source=None):
+        times = []
+        results = []
+        for threaded in (False, True):
+            if source is not None:
+                feeder = multiprocessing.Process(target=paged_source, args=source)
+                feeder.start()
+            seconds, result = timed(shell.piping, shell.parse_cmd(line), None, threaded)
+            if source is not None:
+                feeder.join()
+            times.append(seconds)
+            results.append(result)
+        same = "same output" if results[0] == results[1] else "DIFFERENT OUTPUT"
+        print(f"  {line.replace(name, os.path.basename(name))}")
+        print(f"    serial {times[0]:8.3f}s   threaded {times[1]:8.3f}s   ({same})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = make_log(os.path.join(tmp, "big.log"), size_mb)
+        pipelines = [
+            f"cat {log} | grep ERROR | wc -l",
+            f"cat {log} | grep -i bacon | grep user | grep 09-1 | wc -l",
+            f"cat {log} | grep ERROR | head -n 5",
+        ]
+        print(f"{size_mb} MB log")
+        for line in pipelines:
+            compare(line, log)
+
+        # the same log, 64 KB at a time with 4 ms to fetch every block
+        fifo = os.path.join(tmp, "slow.fifo")
+        os.mkfifo(fifo)
+        print(f"{size_mb} MB log from a paged source")
+        for line in [
+            f"cat {fifo} | grep ERROR | wc -l",
+            f"cat {fifo} | grep -i bacon | grep user | grep 09-1 | wc -l",
+        ]:
+            compare(line, fifo, (fifo, log, 64 * 1024, 0.004))
+
+'''
+legacy_grep:
+the line by line grep the shell used before the bytes search
+'''
+def legacy_grep(filename, to_match, ignore_case=False):
+    '''
+    the original grep loop (decode every line, lower both sides for -i), kept
+    here as the baseline for bench_grep. returns the number of matching lines.
+    '''
+    count = 0
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            line_to_check = line
+            pattern_to_check = to_match
+            if ignore_case:
+                line_to_check = line.lower()
+                pattern_to_check = to_match.lower()
+            if pattern_to_check in line_to_check:
+                count += 1
+    return count
+
+'''
+bench_grep:
+compares the old grep loop with the memory mapped search
+'''
+def bench_grep(size_mb=2048):
+    '''
+    generates a big log (2 GB unless another size is given) and times the old
+    line by line grep against the bytes search, single process and parallel.
+    '''
+    with tempfile.TemporaryDirectory() as tmp:
+        log = make_log(os.path.join(tmp, "big.log"), size_mb)
+        print(f"{size_mb} MB log")
+        for pattern, flags in [("ERROR", ""), ("error", "i"), ("id=4242", ""), ("nomatch", "")]:
+            baseline, expected = timed(legacy_grep, log, pattern, "i" in flags)
+            row = f"  grep -{flags}c {pattern:<8} old {baseline:7.2f}s"
+            for workers in (1, os.cpu_count() or 1):
+                cmd = shell.parse_cmd(f"grep -{flags}c --parallel={workers} {pattern} {log}")
+                seconds, result = timed(shell.piping, cmd)
+                count = int(result["output"].rsplit(":", 1)[1])
+                check = "" if count == expected else " WRONG COUNT"
+                row += f"   {workers} worker(s) {seconds:7.2f}s ({baseline / seconds:5.1f}x){check}"
+            print(row)
+
+'''
+legacy_wc:
+the wc that read the whole file into a string
+'''
+def legacy_wc(filename):
+    '''
+    the original wc counting (read everything, then count, split and encode),
+    kept here as the baseline for bench_wc. returns (lines, words, bytes).
+    '''
+    with open(filename, "r", encoding="utf-8") as f:
+        text = f.read()
+    lines = text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+    return lines, len(text.split()), len(text.encode("utf-8"))
+
+'''
+bench_wc:
+compares the old wc with the chunked count
+'''
+def bench_wc(size_mb=1024):
+    '''
+    times the old read-everything wc against the chunked single pass, for
+    wc -l and for the full count, with and without the numpy kernel.
+    '''
+    with tempfile.TemporaryDirectory() as tmp:
+        log = make_log(os.path.join(tmp, "big.log"), size_mb)
+        print(f"{size_mb} MB log")
+        baseline, expected = timed(legacy_wc, log)
+        print(f"  old wc            {baseline:7.2f}s")
+        kernels = [("numpy", shell.numpy), ("bytes", None)] if shell.numpy is not None else [("bytes", None)]
+        for name, module in kernels:
+            shell.numpy = module
+            for flags in ("-l", "-lwc"):
+                seconds, result = timed(shell.piping, shell.parse_cmd(f"wc {flags} {log}"))
+                counts = tuple(int(field) for field in result["output"].split()[:-1])
+                check = "" if counts == expected[:len(counts)] else " WRONG COUNT"
+                print(f"  wc {flags:<5} {name:<6} {seconds:7.2f}s ({baseline / seconds:5.1f}x){check}")
+
+'''
+make_binary:
+writes a log with control and non-ascii bytes mixed in
+'''
+def make_binary(path, size_mb):
+    '''
+    writes a log-like file (see make_log) where about one byte in a hundred
+    is a control byte or a byte of 128 or more, the kind of file cat -v is for.
+    '''
+    make_log(path, size_mb)
+    rng = random.Random(5143)
+    odd = bytes(range(0, 9)) + bytes(range(11, 32)) + bytes(range(127, 256))
+    with open(path, "r+b") as f:
+        data = bytearray(f.read())
+        for i in range(0, len(data), 100):
+            at = i + rng.randrange(100)
+            if at < len(data) and data[at] != 10:
+                data[at] = rng.choice(odd)
+        f.seek(0)
+        f.write(data)
+    return path
+
+'''
+legacy_cat_v:
+the cat -v the shell used before the translation table
+'''
+def legacy_cat_v(filename):
+    '''
+    the original cat -v loop (build every line a character at a time), kept
+    here as the baseline for bench_cat. the file is read as latin-1 so the
+    old loop sees every byte. returns the number of lines.
+    '''
+    import string
+    count = 0
+    with open(filename, "r", encoding="latin-1", newline="\n") as f:
+        for line in f:
+            new_line = ""
+            for char in line.rstrip("\n"):
+                if char in string.printable or char in ("\t", "\n"):
+                    new_line += char
+                else:
+                    new_line += f"^{chr(ord(char) % 128 + 64)}"
+            count += 1
+    return count
+
+'''
+bench_cat:
+compares the old cat -v with the table based one
+'''
+def bench_cat(size_mb=100):
+    '''
+    times the old character by character cat -v against the translation
+    table, on a log with control and high bytes mixed in, and cat -A on top.
+    '''
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_binary(os.path.join(tmp, "binary.log"), size_mb)
+        out = os.path.join(tmp, "out")
+        print(f"{size_mb} MB binary-ish log")
+        baseline, expected = timed(legacy_cat_v, data)
+        print(f"  old cat -v   {baseline:7.2f}s")
+        for flags in ("-v", "-A"):
+            seconds, _ = timed(shell.piping, shell.parse_cmd(f"cat {flags} {data} > {out}"))
+            with open(out, "rb") as f:
+                lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+            check = "" if lines == expected else " WRONG LINE COUNT"
+            print(f"  cat {flags}       {seconds:7.2f}s ({baseline / seconds:5.1f}x){check}")
+
+
+benchmarks = {
+    "pipeline": bench_pipeline,
+    "grep": bench_grep,
+    "wc": bench_wc,
+    "cat": bench_cat,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print(f"usage: python bench.py <{'|'.join(benchmarks)}> [size in MB]")
+        sys.exit(1)
+    args = [int(arg) for arg in sys.argv[2:]]
+    benchmarks[sys.argv[1]](*args)
@@ -7,13 +7,41 @@ This file is about capturing the user input so that you can mimic shell behavior
 """
 import os
 import sys
+import re
 import stat
+import errno # used to tell a cross-device rename and copy fallbacks apart
+import fnmatch # used to match file name patterns (find -name)
+import mmap # used to search big files without reading them into memory
+import heapq # used to merge the sorted runs of sort
+import tempfile # used for the sorted runs sort spills to disk
 import shutil # used for file "handling" (cp, rm)
 import getpass # used for whoami function
-from time import sleep
+import getopt # used for options that take a value (-n 5, --parallel=4)
+import queue # used to connect threaded pipeline stages
+import select # used to wait on inotify for tail -f
+import ctypes # used to call inotify for tail -f
+import ctypes.util
+import threading # used to run pipeline stages side by side
+import json # used for the caches kept between runs
+from collections import deque
+from array import array # used for the line offsets of LineIndex
+from bisect import bisect_right
+from operator import itemgetter
+from functools import lru_cache # used to keep compiled grep patterns
+from concurrent.futures import ProcessPoolExecutor # used for the parallel grep and sort
+from concurrent.futures import ThreadPoolExecutor # used to work on many files at once
+from time import sleep, time_ns, monotonic
+from itertools import islice # used to stop reading early in streaming commands
+from itertools import chain # used to put the cat -v output back together
 from rich import print
 from getch import Getch
 
+# numpy is optional: wc uses it to count words and characters faster
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 ##################################################################################
 ##################################################################################
 
@@ -25,17 +53,76 @@ cmd_history = []
 history_index = -1
 # current position of the cursor
 cursor_position = 0
+# run each stage of a pipeline in its own thread (SHELL_THREADED_PIPES=1 turns it on)
+threaded_pipes = os.environ.get("SHELL_THREADED_PIPES") == "1"
+# how many batches of lines can wait between two threaded stages
+pipe_queue_size = 16
+# how many lines travel through a pipe together
+pipe_batch_size = 512
+# the state of the threaded pipeline stage running in this thread (see stage_waiting)
+stage_context = threading.local()
+# how often tail -f checks the file when inotify isn't there (seconds)
+follow_poll_min = 0.05
+follow_poll_max = 1.0
+# grep cuts files bigger than this into chunks for its worker processes
+grep_chunk_size = 32 * 1024 * 1024
+# below this much data starting worker processes costs more than it saves
+grep_parallel_min = 8 * 1024 * 1024
+# memory sort uses for a sorted run before spilling it to disk (sort -S)
+sort_buffer_size = 64 * 1024 * 1024
+# how many sorted runs are merged at once
+sort_merge_fan_in = 64
+# the number at the start of a line (or key) for sort -n
+sort_number = re.compile(r"\s*-?(\d+\.?\d*|\.\d+)")
+# LineIndex remembers where every this many lines start
+line_index_every = 1024
+# files smaller than this are quick to scan, so their line indexes aren't saved
+index_min_file_size = 4 * 1024 * 1024
+# the saved line indexes may take this much disk before the oldest are removed
+index_cache_size = 64 * 1024 * 1024
+# how much of a file wc reads at a time
+wc_chunk_size = 1024 * 1024
+# how many threads work on files at the same time (wc, ...)
+io_workers = min(32, (os.cpu_count() or 1) * 4)
+# how much cp copies with one system call
+copy_chunk_size = 16 * 1024 * 1024
+# cp hands the files of a directory to its copy threads this many at a time
+copy_batch_size = 64
+# how often the cp --progress line is redrawn (seconds)
+progress_interval = 0.5
+# how many finished directories walk_parallel holds for a reader that has fallen behind
+walk_queue_size = 256
+# how many files a ResultCache remembers
+cache_max_entries = 10000
+# files and directories changed more recently than this aren't cached (nanoseconds, see mtime_is_settled)
+mtime_settle_ns = 2 * 10**9
+# how long a cached directory listing is trusted, on top of its mtime (seconds)
+dir_cache_ttl = 5.0
+# how many directory listings dir_cache keeps, and how many entries they hold together
+dir_cache_max_dirs = 256
+dir_cache_max_entries = 500000
+# commands that change files, so the cached listings are dropped after they run
+file_changing_commands = {"cp", "mv", "rm", "mkdir", "chmod"}
+# how many directories the du cache remembers
+du_cache_max_entries = 100000
+# the bytes that continue a utf-8 character (wc -m deletes these and counts the rest)
+utf8_continuation = bytes(range(0x80, 0xC0))
+# the umask (cp and chmod use it). reading it means setting it for every thread
+# for a moment, so it is read once here, before the shell starts any threads
+process_umask = os.umask(0)
+os.umask(process_umask)
 
 '''
 parse_cmd:
 parses the command line input into a list of dictionaries
+"args" keeps the flags and params in the order they were typed (see get_options)
 '''
 def parse_cmd(cmd_input):
     command_list = []
     cmds = cmd_input.split("|") # split piping on the | character
     for cmd in cmds:
         # add in/outfile and append to our dictionary
-        parts = {"input":None,"cmd":None,"params":[],"flags":"", "infile": None, "outfile": None, "append": None}
+        parts = {"input":None,"cmd":None,"params":[],"flags":"", "infile": None, "outfile": None, "append": None, "args": []}
         subparts = cmd.strip().split()
         i = 0
         while i < len(subparts):
@@ -56,9 +143,14 @@ def parse_cmd(cmd_input):
                 parts["outfile"] = subparts[i+1]
                 parts["append"] = True
                 i += 2
+            # long options (--name=value) are only kept in "args"
+            elif part.startswith("--"):
+                parts["args"].append(part)
+                i += 1
             # separate the flag and add to "flags"
             elif part.startswith("-") and len(part) > 1:
                 parts["flags"] += part[1:]
+                parts["args"].append(part)
                 i += 1
             else:
                 # parameter handling
@@ -66,11 +158,39 @@ def parse_cmd(cmd_input):
                     parts["cmd"] = part
                 else:
                     parts["params"].append(part)
+                    parts["args"].append(part)
                 i += 1
         # once finished, append the dictionary to command list
         command_list.append(parts)
     return command_list
 
+'''
+get_options:
+reads a command's options with getopt, for options that take a value
+'''
+def get_options(parts, shortopts, longopts=()):
+    '''
+    parses the command's arguments with getopt, so options that take a value
+    (like -n 5 or --parallel=4) work in any position, the same as a real shell.
+
+    input: the command dict, a getopt option string and a list of long options
+    output: (dict of option name -> value, list of the remaining params)
+    raises CommandError on an unknown option or a missing option value
+    '''
+    args = parts.get("args")
+    if args is None:
+        # dictionaries built by hand only have flags and params
+        flags = parts.get("flags") or ""
+        args = (["-" + flags] if flags else []) + list(parts.get("params") or [])
+    try:
+        opts, operands = getopt.gnu_getopt(args, shortopts, list(longopts))
+    except getopt.GetoptError as e:
+        raise CommandError(f"{parts.get('cmd')}: {e.msg}")
+    options = {}
+    for name, value in opts:
+        options[name.lstrip("-")] = value
+    return options, operands
+
 def print_cmd(cmd):
     """This function "cleans" off the command line, then prints
     whatever cmd that is passed to it to the bottom of the terminal.
@@ -86,6 +206,356 @@ def print_cmd(cmd):
     sys.stdout.write(f"\r{cwd}$ {cmd}")
     sys.stdout.flush()
 
+'''
+CommandError:
+raised by streaming commands to stop the pipeline with an error message
+'''
+class CommandError(Exception):
+    '''
+    carries the error message of a streaming command up to piping(), which
+    turns it back into the usual {"output", "error"} dictionary.
+    '''
+    pass
+
+'''
+report_error:
+reports an error that a streaming command goes on after
+'''
+def report_error(message):
+    '''
+    hands the message of an error that doesn't stop the command (like a
+    directory that can't be read in the middle of a walk) to piping() or
+    run_stream(), which give it back as the error once the output is done,
+    the way the real commands print to stderr and carry on. with nothing
+    collecting the errors, the error stops the command instead.
+    '''
+    errors = getattr(stage_context, "errors", None)
+    if errors is None:
+        raise CommandError(message)
+    errors.append(message)
+
+'''
+file_lines:
+yields the lines of an open text file without their newlines
+'''
+def file_lines(f):
+    '''
+    yields the lines of an open text file one at a time, without the newline,
+    so only one line is ever held in memory.
+    '''
+    for line in f:
+        yield line[:-1] if line.endswith("\n") else line
+
+'''
+input_lines:
+returns the piped input of a command as an iterator of lines
+'''
+def input_lines(parts):
+    '''
+    returns the piped input of a command as an iterator of lines, or None when
+    nothing was piped in. the input can be the old style string or any iterable
+    of lines coming from the streaming pipeline.
+    '''
+    data = parts.get("input")
+    if data is None:
+        return None
+    if isinstance(data, str):
+        return iter(data.splitlines())
+    return iter(data)
+
+'''
+run_stream:
+runs a streaming command and gathers its lines into an output dictionary
+'''
+def run_stream(stream_func, parts):
+    '''
+    runs a streaming command on its own (outside of a pipeline) and joins the
+    lines it yields into the usual dictionary.
+
+    input: a stream_* function and the command dict
+    output dict: {"output":string,"error":string}
+    '''
+    # the errors the command reports and goes on after (see report_error)
+    errors = []
+    outer_errors = getattr(stage_context, "errors", None)
+    stage_context.errors = errors
+    try:
+        output = "\n".join(stream_func(parts, input_lines(parts)))
+    except CommandError as e:
+        return {"output": None, "error": "\n".join(errors + [str(e)])}
+    finally:
+        stage_context.errors = outer_errors
+    return {"output": output, "error": "\n".join(errors) or None}
+
+'''
+cache_dir:
+returns the directory the shell keeps its caches in
+'''
+def cache_dir():
+    '''
+    returns $XDG_CACHE_HOME/shell5143 (~/.cache/shell5143 by default),
+    creating it the first time.
+    '''
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "shell5143")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+'''
+mtime_is_settled:
+says if a file's mtime can be trusted to change when the file does
+'''
+def mtime_is_settled(st):
+    '''
+    returns True if the file was last changed more than mtime_settle_ns ago.
+    a write in the same clock tick as the last one wouldn't change the mtime,
+    so the caches only keep results for files whose mtime has settled.
+    '''
+    return time_ns() - st.st_mtime_ns >= mtime_settle_ns
+
+'''
+ResultCache:
+remembers results computed from a file for as long as the file doesn't change
+'''
+class ResultCache:
+    '''
+    a small cache of per-file results that is kept in cache_dir() between
+    runs. an entry is found by the file's device and inode and is only used
+    while the file's mtime_ns and size are still the ones it was computed
+    from. files changed very recently aren't cached at all (see
+    mtime_is_settled). it is safe to use from several threads; save()
+    writes it back if anything changed.
+    '''
+    def __init__(self, name, max_entries=None):
+        self.name = name
+        self.max_entries = max_entries or cache_max_entries
+        self.entries = None
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def path(self):
+        return os.path.join(cache_dir(), self.name)
+
+    def load(self):
+        # an unreadable or broken cache is the same as an empty one
+        try:
+            with open(self.path(), "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, st):
+        '''
+        returns what was stored for the file with this stat result, or None.
+        '''
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            entry = self.entries.get(f"{st.st_dev}:{st.st_ino}")
+        if entry is None or entry[0] != [st.st_mtime_ns, st.st_size]:
+            return None
+        return entry[1]
+
+    def put(self, st, value):
+        '''
+        stores a json-able value for the file with this stat result.
+        '''
+        if not mtime_is_settled(st):
+            return
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            key = f"{st.st_dev}:{st.st_ino}"
+            # moves the key to the end, so the oldest entries go first
+            self.entries.pop(key, None)
+            self.entries[key] = [[st.st_mtime_ns, st.st_size], value]
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+            self.changed = True
+
+    def save(self):
+        '''
+        writes the cache back (through a temporary file, so a second shell
+        never reads half of it). a cache that can't be written is skipped.
+        '''
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                fd, temp = tempfile.mkstemp(dir=cache_dir(), prefix=self.name)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self.entries, f)
+                os.replace(temp, self.path())
+                self.changed = False
+            except OSError:
+                pass
+
+# the counts of the files wc has seen
+wc_cache = ResultCache("wc.json")
+# the sizes of the files in the directories du has read
+du_cache = ResultCache("du.json", du_cache_max_entries)
+
+'''
+DirCache:
+remembers directory listings, with the stat of every entry, for a short time
+'''
+class DirCache:
+    '''
+    an in-memory cache of directory listings, found by the directory's
+    absolute path. a listing is a list of (name, stat result or None, is a
+    directory) entries, the same triples ls uses. it is used again while the
+    directory has the same device, inode and mtime_ns as when it was read,
+    so a repeated listing costs one stat of the directory. a file that is
+    only written to (or chmod'ed) doesn't change its directory's mtime, so a
+    listing is also dropped after dir_cache_ttl seconds, and directories
+    changed very recently aren't cached at all (see mtime_is_settled). the
+    least recently used listings go first when there are too many. it is
+    safe to use from several threads.
+    '''
+    def __init__(self, max_dirs=None, max_entries=None):
+        self.max_dirs = max_dirs or dir_cache_max_dirs
+        self.max_entries = max_entries or dir_cache_max_entries
+        self.listings = {}
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def scandir(self, path, need_stat=False):
+        '''
+        returns the entries of a directory (hidden ones included, in the order
+        the directory gives them), with stat results when need_stat is set.
+        raises OSError like os.scandir. the list is shared, so don't change it.
+        '''
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        version = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        with self.lock:
+            listing = self.listings.get(key)
+            if listing is not None:
+                if listing[0] == version and monotonic() - listing[1] < dir_cache_ttl and (listing[2] or not need_stat):
+                    # moves the key to the end, so the oldest listings go first
+                    del self.listings[key]
+                    self.listings[key] = listing
+                    return listing[3]
+                self.drop(key)
+
+        with os.scandir(path) as entries:
+            found = [(entry.name, entry_stat(entry) if need_stat else None, entry.is_dir(follow_symlinks=False))
+                     for entry in entries]
+        if not mtime_is_settled(st):
+            return found
+        with self.lock:
+            self.drop(key)
+            self.listings[key] = (version, monotonic(), need_stat, found)
+            self.size += len(found)
+            while self.listings and (len(self.listings) > self.max_dirs or self.size > self.max_entries):
+                self.drop(next(iter(self.listings)))
+        return found
+
+    def drop(self, key):
+        # the lock is held by the caller
+        listing = self.listings.pop(key, None)
+        if listing is not None:
+            self.size -= len(listing[3])
+
+    def clear(self):
+        '''
+        forgets every listing.
+        '''
+        with self.lock:
+            self.listings.clear()
+            self.size = 0
+
+# the directories ls (and anything else that lists them) has read lately
+dir_cache = DirCache()
+
+'''
+cached_scandir:
+lists a directory through dir_cache
+'''
+def cached_scandir(path, need_stat=False):
+    '''
+    returns the (name, stat result or None, is a directory) entries of a
+    directory, from dir_cache when it is still good (see DirCache). ls reads
+    directories through it.
+    '''
+    return dir_cache.scandir(path, need_stat)
+
+'''
+walk_parallel:
+reads directory trees on a thread pool
+'''
+def walk_parallel(roots, visit, workers=None, max_depth=None):
+    '''
+    walks the directory trees under roots, reading every directory with
+    os.scandir in a thread pool of io_workers threads. visit(directory,
+    entries, depth) is called in the pool with the list of DirEntry objects
+    of every directory read (the roots have depth 0) and returns (result,
+    subdirectories); the subdirectories it returns are read next, unless
+    they would be deeper than max_depth. visit decides what to go into, so
+    symlinks are only followed if it returns them. the workers hand the
+    subdirectories to the pool themselves, so the walk doesn't wait for
+    the reader between directories. at most walk_queue_size finished
+    directories wait for the reader; past that the workers wait too, so a
+    slow reader doesn't make the walk hold the whole tree in memory.
+
+    output: generator of (directory, depth, result, error) as directories
+    are done. the order changes from run to run, except that a directory
+    always comes before the ones under it; entries come in the order
+    os.scandir gives them, so callers that print should sort what they
+    need sorted. error is the OSError that stopped the directory from being
+    read or visited (and result is None then). stopping the generator
+    drops the pending reads.
+    '''
+    # (directory, depth, result, error, number of subdirectories queued) of every directory done
+    done = queue.Queue(walk_queue_size)
+    stopped = threading.Event()
+    pool = ThreadPoolExecutor(workers or io_workers)
+
+    def report(item):
+        # waits for room in the queue, unless the reader has gone away
+        while not stopped.is_set():
+            try:
+                done.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(directory, depth):
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+            result, subdirectories = visit(directory, entries, depth)
+        except Exception as e:
+            report((directory, depth, None, e, 0))
+            return
+        if max_depth is not None and depth >= max_depth:
+            subdirectories = ()
+        # the result is queued before the subdirectories can be, so it comes out first
+        if not report((directory, depth, result, None, len(subdirectories))):
+            return
+        try:
+            for path in subdirectories:
+                pool.submit(read, path, depth + 1)
+        except RuntimeError:
+            # the walk was stopped and the pool shut down
+            pass
+
+    try:
+        for root in roots:
+            pool.submit(read, root, 0)
+        pending = len(roots)
+        while pending:
+            directory, depth, result, error, queued = done.get()
+            pending += queued - 1
+            if error is not None and not isinstance(error, OSError):
+                raise error
+            yield directory, depth, result, error
+    finally:
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 '''
 help
 - displays correct use of commands.
@@ -123,881 +593,4272 @@ def ls(parts):
     -a : shows all files
     -l : long listing
     -h : human-readable format/sizes
+    -t : sort by modification time, newest first
+    -S : sort by size, largest first
+    -r : reverse the order
+    -U : don't sort; print the entries one per line as they are read
+    -f : like -U, and shows all files
+    -R : list the subdirectories too, all the way down
 
     input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
     output dict: {"output":string,"error":string}
     '''
-    input = parts.get("input", None)
-    flags = parts.get("flags", None) or ""
-    params = parts.get("params", None) or []
+    return run_stream(stream_ls, parts)
+
+
+'''
+stream_ls:
+streaming version of ls used by the pipeline
+'''
+def stream_ls(parts, lines):
+    '''
+    lists directories with os.scandir, which gives the names and types in one
+    go, and only stats the entries when -l, -t or -S need it. unsorted
+    listings (-U, -f) are printed as they are read, so a directory with
+    millions of entries starts printing right away. -R reads the
+    subdirectories ahead in a thread pool (see list_tree).
+
+    input: the command dict and an iterator of piped lines (not used)
+    output: generator of lines, raises CommandError on a bad directory
+    '''
+    options, params = get_options(parts, "alhtSrUfR")
+    unsorted = "U" in options or "f" in options
+    # -f shows everything, like the old unix ls
+    if "f" in options:
+        options["a"] = ""
+
+    # determine which directories to list, defaulting to the current one
+    directories = params or ["."]
+
+    if "R" in options:
+        # files are listed as themselves before the walk starts
+        files = [path for path in directories if not os.path.isdir(path) and os.path.lexists(path)]
+        for path in files:
+            yield from ls_lines([(path, ls_stat(path), False)], options)
+        yield from list_tree([path for path in directories if path not in files], options, first=not files)
+        return
+
+    for i, directory in enumerate(directories):
+        # a file is listed as itself
+        if not os.path.isdir(directory) and os.path.lexists(directory):
+            yield from ls_lines([(directory, ls_stat(directory), False)], options)
+            continue
+        if len(directories) > 1:
+            if i > 0:
+                yield ""
+            yield f"{directory}:"
+        if unsorted:
+            yield from ls_lines(scan_dir(directory, options), options)
+        else:
+            yield from ls_lines(list_dir(directory, options), options)
+
+
+'''
+scan_dir:
+reads a directory for ls one entry at a time
+'''
+def scan_dir(directory, options):
+    '''
+    yields (name, stat result or None, is a directory) for the entries of a
+    directory as os.scandir reads them. the type comes with the entry for
+    free, and the stat comes from the DirEntry (which keeps it), only when
+    -l, -t or -S need it. symlinks don't count as directories.
+    '''
+    need_stat = "l" in options or "t" in options or "S" in options
+    show_all = "a" in options
+    with open_dir(directory) as entries:
+        for entry in entries:
+            # handles the -a flag (show all files, including hidden ones)
+            if show_all or not entry.name.startswith("."):
+                yield entry.name, entry_stat(entry) if need_stat else None, entry.is_dir(follow_symlinks=False)
 
-    # determine which directory to list
-    if len(params) > 0:
-        # use a specified directory
-        directory = params[0]
+
+'''
+list_dir:
+reads and sorts a directory for ls
+'''
+def list_dir(directory, options):
+    '''
+    returns the (name, stat result or None, is a directory) entries of a
+    directory, sorted by name, or by time (-t) or size (-S), newest or
+    largest first, and reversed by -r. the directory is read through
+    cached_scandir, so listing it again soon after costs a single stat.
+    '''
+    need_stat = "l" in options or "t" in options or "S" in options
+    try:
+        entries = cached_scandir(directory, need_stat)
+    except OSError as e:
+        raise dir_error(directory, e)
+    # the cached list is shared, so this always makes a new one
+    if "a" in options:
+        listing = list(entries)
     else:
-        # default to the current directory
-        directory = "."
+        listing = [entry for entry in entries if not entry[0].startswith(".")]
+    # sorts the files alphabetically, and by time or size on top of that
+    listing.sort(key=itemgetter(0))
+    if "t" in options:
+        listing.sort(key=lambda entry: entry[1].st_mtime_ns if entry[1] else 0, reverse=True)
+    elif "S" in options:
+        listing.sort(key=lambda entry: entry[1].st_size if entry[1] else 0, reverse=True)
+    if "r" in options:
+        listing.reverse()
+    return listing
 
+
+'''
+open_dir:
+opens a directory for ls
+'''
+def open_dir(directory):
+    '''
+    returns os.scandir of the directory, turning errors into ls messages.
+    '''
     try:
-        # get the list of files in the directory
-        files = os.listdir(directory)
+        return os.scandir(directory)
+    except OSError as e:
+        raise dir_error(directory, e)
+
 
-        # handles the -a flag (show all files, including hidden ones)
-        if "a" not in flags:
-            files = [f for f in files if not f.startswith(".")]
+'''
+dir_error:
+turns an error reading a directory into the ls message for it
+'''
+def dir_error(directory, e):
+    if isinstance(e, FileNotFoundError):
+        return CommandError(f"ls: cannot access '{directory}': No such file or directory")
+    if isinstance(e, PermissionError):
+        return CommandError(f"ls: cannot open directory '{directory}': Permission denied")
+    return CommandError(f"ls: {str(e)}")
 
-        # sorts the files alphabetically
-        files.sort()
 
-        # handles the -l flag (long listing format)
-        if "l" in flags:
-            output_lines = []
-            for file in files:
-                filepath = os.path.join(directory, file)
-                try:
-                    stat_info = os.stat(filepath)
-                    size = stat_info.st_size
-
-                    # use actual file permissions
-                    permissions = stat.filemode(stat_info.st_mode)
-
-                    # handles the -h flag (human readable sizes)
-                    if "h" in flags:
-                        if size >= 1024**3:
-                            size_str = f"{size/1024**3:.1f}G"
-                        elif size >= 1024**2:
-                            size_str = f"{size/1024**2:.1f}M"
-                        elif size >= 1024:
-                            size_str = f"{size/1024:.1f}K"
-                        else:
-                            size_str = f"{size}B"
-                    else:
-                        size_str = str(size)
+'''
+entry_stat:
+stats a directory entry, or returns None if it can't be
+'''
+def entry_stat(entry):
+    try:
+        return entry.stat()
+    except OSError:
+        return None
 
-                    output_lines.append(f"{permissions} {size_str:>8} {file}")
 
-                except OSError:
-                    output_lines.append(f"?--------- {'?':>8} {file}")
-            
-            output = "\n".join(output_lines)
+'''
+ls_stat:
+stats a single file for ls
+'''
+def ls_stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
 
-        else:
-            # simple listing with just filenames
-            output = "  ".join(files)
-        
-        return {"output": output, "error": None}
-    
-    except FileNotFoundError:
-        return {"output": None, "error": f"ls: cannot access '{directory}': No such file or directory"}
-    except PermissionError:
-        return {"output": None, "error": f"ls: cannot open directory '{directory}': Permission denied"}
-    except Exception as e:
-        return {"output": None, "error": f"ls: {str(e)}"}
 
 '''
-exit:
-exit the shell
+ls_lines:
+formats the entries of one directory
 '''
-def exit():
+def ls_lines(entries, options):
     '''
-    forces termination of command shell.
+    yields the listing of (name, stat result, is a directory) entries: one line per entry for
+    -l (and for -U and -f, so they can stream), otherwise all the names on one line.
     '''
-    os.exit
+    if "l" not in options:
+        if "U" in options or "f" in options:
+            for name, st, is_dir in entries:
+                yield name
+        else:
+            names = [name for name, st, is_dir in entries]
+            if names:
+                # simple listing with just filenames
+                yield "  ".join(names)
+        return
+
+    # handles the -l flag (long listing format)
+    for name, st, is_dir in entries:
+        if st is None:
+            yield f"?--------- {'?':>8} {name}"
+            continue
+        # use actual file permissions
+        permissions = stat.filemode(st.st_mode)
+        # handles the -h flag (human readable sizes)
+        size_str = human_size(st.st_size) if "h" in options else str(st.st_size)
+        yield f"{permissions} {size_str:>8} {name}"
+
 
 '''
-mkdir:
-creates a new directory 
+list_tree:
+lists directories and everything below them (ls -R)
 '''
-def mkdir(parts):
+def list_tree(directories, options, first=True):
     '''
-    creates a new directory within the current directory.
-
-    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
-    output dict: {"output":string,"error":string}
+    yields the listing of every directory under the given ones, each under a
+    "path:" header, in the same order as a plain depth-first walk. as soon
+    as a directory has been read, all of its subdirectories are handed to a
+    thread pool, so they are being read (and stat'ed for -l) while the
+    directories before them are printed. symlinks to directories aren't
+    followed. a directory that can't be read is reported (see report_error)
+    and skipped. first says nothing has been listed before the first
+    directory, so it needs no empty line above it.
     '''
-    params = parts.get("params")    
-    if not params:
-        return {"output": None, "error": "mkdir: missing operand"}
-
-    # returns the inputted directory name
-    path = params[0]  
-
+    def read(directory):
+        try:
+            entries = list_dir(directory, options)
+        except CommandError as e:
+            return None, None, str(e)
+        # the subdirectories, in the order they are listed
+        subdirectories = [os.path.join(directory, name) for name, st, is_dir in entries if is_dir]
+        return entries, subdirectories, None
+
+    pool = ThreadPoolExecutor(io_workers)
     try:
-        os.mkdir(path)
-        return {"output": None, "error": None}
-    except FileExistsError:
-        return {"output": None, "error": f"mkdir: cannot create directory '{path}': File exists"}
-    except PermissionError:
-        return {"output": None, "error": f"mkdir: cannot create directory '{path}': Permission denied"}
-    except Exception as e:
-        return {"output": None, "error": f"mkdir: {str(e)}"}
+        # directories still to print, the next one last
+        pending = [(directory, pool.submit(read, directory)) for directory in reversed(directories)]
+        while pending:
+            directory, future = pending.pop()
+            entries, subdirectories, error = future.result()
+            if error is not None:
+                # like a real ls -R, a directory that can't be read doesn't stop the others
+                report_error(error)
+                continue
+            if not first:
+                yield ""
+            first = False
+            yield f"{directory}:"
+            yield from ls_lines(entries, options)
+            pending.extend((path, pool.submit(read, path)) for path in reversed(subdirectories))
+    finally:
+        # when the reader stops early (ls -R | head), the read-ahead is dropped
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 '''
-cd:
-changes the current working directory
+human_size:
+turns a size in bytes into the short form ls -h shows
 '''
-def cd(parts):
+def human_size(size):
     '''
-    changes the current working directory.
+    returns the size with a B, K, M or G unit, like 512B, 1.5K or 3.2M.
+    '''
+    if size >= 1024**3:
+        return f"{size/1024**3:.1f}G"
+    elif size >= 1024**2:
+        return f"{size/1024**2:.1f}M"
+    elif size >= 1024:
+        return f"{size/1024:.1f}K"
+    else:
+        return f"{size}B"
+
+'''
+find:
+searches directory trees for files
+'''
+def find(parts):
+    '''
+    searches directory trees for the files that match every test given.
+
+    usage: find [path...] [tests]
+
+    tests:
+    -name pattern : the name matches a shell pattern (*, ?, [...]); quote it: '*.log'
+    -iname pattern : like -name, ignoring case
+    -type c : the file is a f (file), d (directory), l (symlink), p, s, b or c
+    -size [+-]n[ckMG] : the size, rounded up to 512 byte blocks (or c bytes, k, M, G),
+                        is more than (+), less than (-) or exactly n
+    -mtime [+-]n : the file was changed more than, less than or exactly n days ago
+    -newer file : the file was changed after file was
+    -maxdepth n : don't go more than n directories below the paths
 
     input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
     output dict: {"output":string,"error":string}
     '''
+    return run_stream(stream_find, parts)
 
-    try:
-        # retrieves the list of parameters from parts
-        params = parts.get("params",None) or []
 
-        # if there are no params, default to the home directory
-        if not params:
-            target_directory = os.path.expanduser("~")
-        # if there is at least one param, store the first one in arg
-        else:
-            arg = params[0]
+'''
+stream_find:
+streaming version of find used by the pipeline
+'''
+def stream_find(parts, lines):
+    '''
+    walks the trees with walk_parallel and tests the entries in the worker
+    that read their directory, the cheap tests first: the name, then the
+    type (which scandir already knows), and only then the ones that need a
+    stat. matches are yielded as each directory is done, so the first ones
+    come out while the rest of the tree is still being read. the
+    directories come in the order they are done (which changes between
+    runs, though a directory is always before what is under it), and the
+    matches within each directory are sorted. a path or
+    directory that can't be read is reported (see report_error) and
+    skipped, like the real find does.
+
+    input: the command dict and an iterator of piped lines (not used)
+    output: generator of paths, raises CommandError on a bad test
+    '''
+    args = [strip_quotes(arg) for arg in parts.get("args") or parts.get("params") or []]
+    # the paths come before the first test
+    split = next((i for i, arg in enumerate(args) if arg.startswith("-")), len(args))
+    roots = args[:split] or ["."]
+    tests, max_depth = find_tests(args[split:])
+
+    def visit(directory, entries, depth):
+        found = []
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            if find_match(entry, tests):
+                found.append(entry.path)
+        # the directories come in any order, but what is in each one is sorted
+        found.sort()
+        return found, subdirectories
+
+    walk = []
+    for root in roots:
+        try:
+            entry = PathEntry(root)
+        except OSError as e:
+            report_error(f"find: '{root}': {e.strerror}")
+            continue
+        if find_match(entry, tests):
+            yield root
+        if entry.is_dir(follow_symlinks=False) and (max_depth is None or max_depth > 0):
+            walk.append(root)
+    if not walk:
+        return
+
+    for directory, depth, found, error in walk_parallel(walk, visit, max_depth=None if max_depth is None else max_depth - 1):
+        if error is not None:
+            report_error(f"find: '{directory}': {error.strerror}")
+            continue
+        yield from found
 
-            # if the argument is "~", go to the home directory
-            if arg == "~":
-                target_directory = os.path.expanduser("~")
-            # if the argument is "..", move up one directory from the current one
-            elif arg == "..":
-                target_directory = os.path.dirname(os.getcwd())
-            # otherwise, assume the user provided a valid path
-            else:
-                target_directory = os.path.expanduser(arg)
 
-        # changes the current working directory
-        os.chdir(target_directory)
-        # if successful, return no output or error
-        return {"output": None, "error": None}
+'''
+find_tests:
+turns the tests of a find command into functions
+'''
+def find_tests(args):
+    '''
+    returns (tests, max_depth). every test is a function that takes a
+    DirEntry (or PathEntry) and says if it matches; they are sorted so the
+    ones that don't need a stat come first. raises CommandError on an
+    unknown test or a bad value.
+    '''
+    # (cost, test): 0 needs nothing, 1 needs the type scandir gives, 2 needs a stat
+    tests = []
+    max_depth = None
+    i = 0
+    while i < len(args):
+        name = args[i]
+        if name not in ("-name", "-iname", "-type", "-size", "-mtime", "-newer", "-maxdepth"):
+            raise CommandError(f"find: unknown predicate '{name}'")
+        if i + 1 >= len(args):
+            raise CommandError(f"find: missing argument to '{name}'")
+        value = args[i + 1]
+        i += 2
+
+        if name in ("-name", "-iname"):
+            match = re.compile(fnmatch.translate(value), re.IGNORECASE if name == "-iname" else 0).match
+            tests.append((0, lambda entry, match=match: match(entry.name) is not None))
+        elif name == "-type":
+            tests.append(type_test(value))
+        elif name == "-size":
+            compare, number, unit = find_number(name, value, "ckMGbw")
+            size = {"c": 1, "w": 2, "b": 512, "k": 1024, "M": 1024**2, "G": 1024**3}[unit or "b"]
+            # the size is counted in whole units, rounded up
+            tests.append((2, lambda entry, compare=compare, number=number, size=size:
+                          compare(-(-entry.stat(follow_symlinks=False).st_size // size), number)))
+        elif name == "-mtime":
+            compare, number, unit = find_number(name, value, "")
+            now = time_ns()
+            tests.append((2, lambda entry, compare=compare, number=number, now=now:
+                          compare((now - entry.stat(follow_symlinks=False).st_mtime_ns) // (86400 * 10**9), number)))
+        elif name == "-newer":
+            try:
+                newer = os.stat(value).st_mtime_ns
+            except OSError as e:
+                raise CommandError(f"find: '{value}': {e.strerror}")
+            tests.append((2, lambda entry, newer=newer: entry.stat(follow_symlinks=False).st_mtime_ns > newer))
+        else:
+            if not value.isdigit():
+                raise CommandError(f"find: invalid argument '{value}' to '-maxdepth'")
+            max_depth = int(value)
+
+    tests.sort(key=itemgetter(0))
+    return [test for cost, test in tests], max_depth
 
-    # if the directory doesn't exist, return an error message
-    except FileNotFoundError:
-        return {"output": None, "error": f"cd: no such file or directory: {params[0]}"}
-    # if the path is not a directory, return an error message
-    except NotADirectoryError:
-        return {"output": None, "error": f"cd: not a directory: {params[0]}"}
-    # if the user doesn't have permission to access the directory, return an error message
-    except PermissionError:
-        return {"output": None, "error": f"cd: permission denied: {params[0]}"}
-    # if anything else goes wrong, return a error message
-    except Exception as e:
-        return {"output": None, "error": f"cd: {str(e)}"}
-    
 
 '''
-pwd:
-prints the current working directory to the terminal
+type_test:
+makes the test for find -type
 '''
-def pwd(parts):
+def type_test(kind):
     '''
-    prints the current working directory to the terminal.
-
-    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
-    output dict: {"output":string,"error":string}
+    returns (cost, test) for a file type letter. directories, symlinks and
+    files are known from scandir without a stat; the rest need one.
     '''
-    try:
-        # asks the OS for the current working directory
-        current_directory = os.getcwd()
-        # if everything works, return the current directory with no error
-        return {"output":current_directory, "error":None}
-    # if anything goes wrong, return an error message
-    except Exception as e:
-        return {"output":None, "error": f"pwd:{str(e)}"}
+    if kind == "d":
+        return 1, lambda entry: entry.is_dir(follow_symlinks=False)
+    if kind == "l":
+        return 1, lambda entry: entry.is_symlink()
+    if kind == "f":
+        return 1, lambda entry: entry.is_file(follow_symlinks=False)
+    kinds = {"p": stat.S_ISFIFO, "s": stat.S_ISSOCK, "b": stat.S_ISBLK, "c": stat.S_ISCHR}
+    if kind not in kinds:
+        raise CommandError(f"find: invalid argument '{kind}' to '-type'")
+    return 2, lambda entry: kinds[kind](entry.stat(follow_symlinks=False).st_mode)
+
 
 '''
-mv:
-moves files/directories to a different location and renames files
+find_number:
+reads a [+-]n number of a find test
 '''
-def mv(parts):
-    params = parts.get("params") or []
-    if len(params)<2:
-        return {"output":None, "error":"mv: missing file operation"}
+def find_number(name, value, units):
+    '''
+    returns (compare, n, unit) for values like +5, -10k or 3: compare(a, n)
+    is a > n for +, a < n for - and a == n otherwise.
+    '''
+    match = re.fullmatch(r"([+-]?)(\d+)([" + units + r"]?)" if units else r"([+-]?)(\d+)()", value)
+    if match is None:
+        raise CommandError(f"find: invalid argument '{value}' to '{name}'")
+    sign, number, unit = match.groups()
+    compare = {"+": int.__gt__, "-": int.__lt__, "": int.__eq__}[sign]
+    return compare, int(number), unit
 
-    source, dest = params[0], params[1]
 
+'''
+find_match:
+runs the find tests on one entry
+'''
+def find_match(entry, tests):
     try:
-        os.rename(source, dest)
-        return {"output":None, "error":None}
-    except FileNotFoundError:
-        return {"output":None, "error":f"mv:{source}: There is no such file exixts"}
-    except PermissionError:
-        return{"output":None, "error":f"mv:permission denied"}        
-    except Exception as e:
-        return{"output":None, "error":f"mv:{str(e)}"}    
-    
+        for test in tests:
+            if not test(entry):
+                return False
+        return True
+    except OSError:
+        # the file went away between the listing and the stat
+        return False
+
 
 '''
-cp:
-makes a copy of the first argument into the second argument
+PathEntry:
+a path from the command line that looks like a scandir entry
 '''
-def cp(parts):
+class PathEntry:
     '''
-    makes a copy of the first argument into the second argument.
-
-    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
-    output dict: {"output":string,"error":string}
+    stands in for os.DirEntry for the paths find starts from, so the same
+    tests work on both. the lstat is done once, when it is made (and raises
+    OSError if the path isn't there).
     '''
-    params = parts.get("params") or []
-    if len(params)<2:
-        return {"output":None, "error":"cp: missing file operation"}
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path.rstrip("/")) or path
+        self.st = os.lstat(path)
 
-    source, dest = params[0], params[1]
+    def stat(self, follow_symlinks=True):
+        return self.st if not follow_symlinks else os.stat(self.path)
+
+    def is_dir(self, follow_symlinks=True):
+        return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+
+    def is_file(self, follow_symlinks=True):
+        return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.st.st_mode)
 
-    try:
-        shutil.copy(source, dest)   # copies contents of a given source file, 
-                                    # and creates a destination file with those contents.
-        return {"output":None, "error":None}
-    except FileNotFoundError:
-        return {"output":None, "error":f"cp:{source}: There is no such file exixts"}
-    except PermissionError:
-        return{"output":None, "error":f"cp:permission denied"}
-    except Exception as e:
-        return{"output":None, "error":f"cp:{str(e)}"} 
 
 '''
-rm:
-allows the user to delete a file/directory by passing its name
+strip_quotes:
+takes the quotes off an argument typed as 'x' or "x"
 '''
-def rm(parts):
-    """
-    removes files or directories.
+def strip_quotes(arg):
+    if len(arg) >= 2 and arg[0] == arg[-1] and arg[0] in "'\"":
+        return arg[1:-1]
+    return arg
 
-    flags:
-    -r : recursive (delete directories and their contents)
-    -f : force (ignore errors, no prompts)
+
+'''
+du:
+shows how much disk space directories use
+'''
+def du(parts):
+    '''
+    shows the disk space used by every directory under the given ones (the
+    current one by default), in kilobytes.
+
+    flags:
+    -s : only show the total of each argument
+    -h : human readable sizes (K, M, G)
+    -d n : only show directories down to n levels below the arguments
+    --apparent-size : add up the sizes of the files instead of the disk blocks they use
+    --no-cache : read every directory again (see below)
+
+    files with more than one hard link are counted once. what a directory
+    holds is remembered between runs and used again while the directory's
+    mtime doesn't change, so a second du of a big tree only has to stat the
+    directories. a file that grew in place doesn't change its directory's
+    mtime, so use --no-cache after logs and the like have grown.
 
     input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
-    output: dict: {"output":string,"error":string}
-    """
-    params = parts.get("params") or []
-    flags = parts.get("flags") or ""
+    output dict: {"output":string,"error":string}
+    '''
+    return run_stream(stream_du, parts)
+
+
+'''
+stream_du:
+streaming version of du used by the pipeline
+'''
+def stream_du(parts, lines):
+    '''
+    yields the sizes of every argument in turn, each as soon as its tree has
+    been added up. a file or directory that can't be read is reported (see
+    report_error) and left out, like the real du does.
+
+    input: the command dict and an iterator of piped lines (not used)
+    output: generator of lines, raises CommandError on a bad option
+    '''
+    options, params = get_options(parts, "shd:", ["apparent-size", "max-depth=", "no-cache"])
+    depth_text = options.get("d", options.get("max-depth"))
+    if "s" in options:
+        max_depth = 0
+    elif depth_text is not None:
+        if not depth_text.isdigit():
+            raise CommandError(f"du: invalid maximum depth '{depth_text}'")
+        max_depth = int(depth_text)
+    else:
+        max_depth = None
+    # the disk blocks (st_blocks are 512 bytes) or the apparent size
+    apparent = "apparent-size" in options
+    cache = None if "no-cache" in options else du_cache
+
+    # the (dev, inode) of the hard linked files already counted, for every argument together
+    seen = set()
+    for root in params or ["."]:
+        try:
+            st = os.lstat(root)
+        except OSError as e:
+            report_error(f"du: cannot access '{root}': {e.strerror}")
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            totals, children, tree_errors = du_tree(root, st, apparent, seen, cache)
+            for message in tree_errors:
+                report_error(message)
+        else:
+            totals, children = {root: du_size(st, apparent)}, {}
+
+        # prints the directories children first, like the real du
+        def show(path, depth):
+            if max_depth is None or depth < max_depth:
+                for child in sorted(children.get(path, ())):
+                    yield from show(child, depth + 1)
+            if max_depth is None or depth <= max_depth:
+                size = totals[path]
+                yield f"{human_size(size) if 'h' in options else -(-size // 1024)}\t{path}"
+        yield from show(root, 0)
+    if cache is not None:
+        cache.save()
+
+
+'''
+du_tree:
+adds up the sizes of everything under a directory
+'''
+def du_tree(root, root_st, apparent, seen, cache=None):
+    '''
+    walks the directory root with walk_parallel. the worker that reads a
+    directory adds up the sizes of its files, and keeps them (with the
+    names of its subdirectories) in the cache under the directory's stat
+    from before it was read. a subdirectory whose stat still matches its
+    cache entry isn't read at all: its files come from the cache and only
+    its own subdirectories are stat'ed, so an unchanged subtree costs one
+    stat per directory. hard linked files are counted once, by (dev, inode),
+    in the first directory that gets to them, whether it was read or cached.
+
+    output: (total size of every directory by path, subdirectories of
+    every directory by path, list of error messages)
+    '''
+    lock = threading.Lock()
+    errors = []
+    # the stat of every directory from before it is read (what the cache is checked against)
+    dir_stats = {root: root_st}
+    # the directory every directory to read is in
+    dir_parents = {root: None}
+
+    # the cache keeps both sizes, so du and du --apparent-size can share it
+    pick = 1 if apparent else 0
+
+    def count_linked(dev, linked):
+        size = 0
+        with lock:
+            for inode, blocks, apparent_size in linked:
+                if (dev, inode) not in seen:
+                    seen.add((dev, inode))
+                    size += apparent_size if apparent else blocks
+        return size
+
+    def from_cache(path, parent, st, records, subdirectories):
+        # unfolds a cached directory and the cached ones under it, and walks the others
+        pending = [(path, parent, st)]
+        while pending:
+            path, parent, st = pending.pop()
+            cached = cache.get(st) if cache is not None else None
+            if cached is None:
+                dir_stats[path] = st
+                dir_parents[path] = parent
+                subdirectories.append(path)
+                continue
+            files_size, linked, names = cached
+            records.append((path, parent, du_size(st, apparent) + files_size[pick] + count_linked(st.st_dev, linked)))
+            for name in names:
+                child = os.path.join(path, name)
+                try:
+                    child_st = os.lstat(child)
+                except OSError as e:
+                    errors.append(f"du: cannot access '{child}': {e.strerror}")
+                    continue
+                if stat.S_ISDIR(child_st.st_mode):
+                    pending.append((child, path, child_st))
+
+    def visit(directory, entries, depth):
+        # (path, parent, size of the directory and its files) of the directories done here
+        records = []
+        subdirectories = []
+        files_size = [0, 0]
+        linked = []
+        names = []
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError as e:
+                errors.append(f"du: cannot access '{entry.path}': {e.strerror}")
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                names.append(entry.name)
+                from_cache(entry.path, directory, st, records, subdirectories)
+            elif st.st_nlink > 1:
+                linked.append((st.st_ino, du_size(st, False), du_size(st, True)))
+            else:
+                files_size[0] += du_size(st, False)
+                files_size[1] += du_size(st, True)
+        st = dir_stats[directory]
+        if cache is not None:
+            cache.put(st, [files_size, linked, names])
+        records.insert(0, (directory, dir_parents[directory],
+                           du_size(st, apparent) + files_size[pick] + count_linked(st.st_dev, linked)))
+        return records, subdirectories
+
+    # the size of every directory and its files, and the subdirectories of each
+    totals = {}
+    children = {}
+    order = []
+    root_subdirectories = []
+    if cache is not None and cache.get(root_st) is not None:
+        # the whole tree may be cached, and then nothing needs reading
+        from_cache(root, None, root_st, order, root_subdirectories)
+    walk = root_subdirectories if order else [root]
+    for directory, depth, records, error in walk_parallel(walk, visit):
+        if error is not None:
+            errors.append(f"du: cannot read directory '{directory}': {error.strerror}")
+            continue
+        order.extend(records)
+
+    for path, parent, size in order:
+        totals[path] = size
+        if parent is not None:
+            children.setdefault(parent, []).append(path)
+    # adds every directory into its parent, the deepest first
+    for path, parent, size in reversed(order):
+        if parent is not None and parent in totals:
+            totals[parent] += totals[path]
+    return totals, children, errors
+
+
+'''
+du_size:
+the size du counts for one stat result
+'''
+def du_size(st, apparent):
+    return st.st_size if apparent else st.st_blocks * 512
+
+
+'''
+exit:
+exit the shell
+'''
+def exit():
+    '''
+    forces termination of command shell.
+    '''
+    os.exit
+
+'''
+mkdir:
+creates a new directory 
+'''
+def mkdir(parts):
+    '''
+    creates new directories.
+
+    flags:
+    -p : make missing parent directories too, and don't complain about directories that are already there
+
+    names can have {a,b,c} and {1..10} in them to make many directories at
+    once, like mkdir -p project/{src,test}/part{1..3}
 
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output dict: {"output":string,"error":string}
+    '''
+    try:
+        options, params = get_options(parts, "p")
+    except CommandError as e:
+        return {"output": None, "error": str(e)}
     if not params:
-        return {"output": None, "error": "rm: missing operand"}
+        return {"output": None, "error": "mkdir: missing operand"}
 
-    # used as an error message display
+    # the directories this command has made or found, so their parents aren't tried again
+    known = set()
     errors = []
+    for param in params:
+        for path in brace_expand(param):
+            try:
+                if "p" in options:
+                    make_parents(path, known)
+                else:
+                    os.mkdir(path)
+            except FileExistsError:
+                errors.append(f"mkdir: cannot create directory '{path}': File exists")
+            except FileNotFoundError:
+                errors.append(f"mkdir: cannot create directory '{path}': No such file or directory")
+            except PermissionError:
+                errors.append(f"mkdir: cannot create directory '{path}': Permission denied")
+            except Exception as e:
+                errors.append(f"mkdir: {str(e)}")
+    return {"output": None, "error": "\n".join(errors) or None}
 
-    for path in params:
+
+'''
+make_parents:
+makes a directory and whatever parents it is missing (mkdir -p)
+'''
+def make_parents(path, known):
+    '''
+    makes the directory path, and its missing parents first. the directory
+    itself is tried first and the parents only when that fails because one
+    is missing, so making many directories next to each other costs one
+    mkdir each (os.makedirs stats every parent every time). known is the
+    set of directories already made or found by this command; they are
+    skipped without a system call, and new ones are added to it.
+    '''
+    path = os.path.normpath(path)
+    if path in known:
+        return
+    try:
+        os.mkdir(path)
+    except FileNotFoundError:
+        parent = os.path.dirname(path)
+        if not parent or parent == path or parent in known:
+            raise
+        make_parents(parent, known)
+        os.mkdir(path)
+    except FileExistsError:
+        if not os.path.isdir(path):
+            raise
+    known.add(path)
+
+
+'''
+brace_expand:
+expands {a,b,c} and {1..5} in a word, the way the shell does
+'''
+def brace_expand(word):
+    '''
+    returns the words a word stands for: "a{b,c}d" gives abd and acd,
+    "x{1..3}" gives x1, x2 and x3 ({01..10} keeps the zeros, {5..1} counts
+    down), and groups can be nested or follow each other
+    ("{a,b}/{c,d{1..2}}"). braces that aren't a group ({} or {x}) are kept
+    as they are.
+    '''
+    depth = 0
+    start = None
+    for i, char in enumerate(word):
+        if char == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                choices = brace_choices(word[start + 1:i])
+                if choices is not None:
+                    prefix, suffix = word[:start], word[i + 1:]
+                    return [expanded for choice in choices for expanded in brace_expand(prefix + choice + suffix)]
+    return [word]
+
+
+'''
+brace_choices:
+splits the inside of a {...} group into its choices
+'''
+def brace_choices(body):
+    '''
+    returns the choices of a brace group (without the braces), or None if
+    it isn't one: commas at the top level split it, and n..m is a range.
+    '''
+    choices = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(body):
+        if char == "{":
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+        elif char == "," and depth == 0:
+            choices.append(body[start:i])
+            start = i + 1
+    if choices:
+        choices.append(body[start:])
+        return choices
+    match = re.fullmatch(r"(-?\d+)\.\.(-?\d+)", body)
+    if match is None:
+        return None
+    first, last = match.group(1), match.group(2)
+    # {01..10} pads every number to the same width
+    width = max(len(first), len(last)) if first.lstrip("-").startswith("0") or last.lstrip("-").startswith("0") else 0
+    step = 1 if int(last) >= int(first) else -1
+    return [str(number).zfill(width) for number in range(int(first), int(last) + step, step)]
+
+
+'''
+cd:
+changes the current working directory
+'''
+def cd(parts):
+    '''
+    changes the current working directory.
+
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output dict: {"output":string,"error":string}
+    '''
+
+    try:
+        # retrieves the list of parameters from parts
+        params = parts.get("params",None) or []
+
+        # if there are no params, default to the home directory
+        if not params:
+            target_directory = os.path.expanduser("~")
+        # if there is at least one param, store the first one in arg
+        else:
+            arg = params[0]
+
+            # if the argument is "~", go to the home directory
+            if arg == "~":
+                target_directory = os.path.expanduser("~")
+            # if the argument is "..", move up one directory from the current one
+            elif arg == "..":
+                target_directory = os.path.dirname(os.getcwd())
+            # otherwise, assume the user provided a valid path
+            else:
+                target_directory = os.path.expanduser(arg)
+
+        # changes the current working directory
+        os.chdir(target_directory)
+        # if successful, return no output or error
+        return {"output": None, "error": None}
+
+    # if the directory doesn't exist, return an error message
+    except FileNotFoundError:
+        return {"output": None, "error": f"cd: no such file or directory: {params[0]}"}
+    # if the path is not a directory, return an error message
+    except NotADirectoryError:
+        return {"output": None, "error": f"cd: not a directory: {params[0]}"}
+    # if the user doesn't have permission to access the directory, return an error message
+    except PermissionError:
+        return {"output": None, "error": f"cd: permission denied: {params[0]}"}
+    # if anything else goes wrong, return a error message
+    except Exception as e:
+        return {"output": None, "error": f"cd: {str(e)}"}
+    
+
+'''
+pwd:
+prints the current working directory to the terminal
+'''
+def pwd(parts):
+    '''
+    prints the current working directory to the terminal.
+
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output dict: {"output":string,"error":string}
+    '''
+    try:
+        # asks the OS for the current working directory
+        current_directory = os.getcwd()
+        # if everything works, return the current directory with no error
+        return {"output":current_directory, "error":None}
+    # if anything goes wrong, return an error message
+    except Exception as e:
+        return {"output":None, "error": f"pwd:{str(e)}"}
+
+'''
+cp:
+makes copies of files, and of whole directories with -r
+'''
+def cp(parts):
+    '''
+    copies a file, or copies files and directories into a directory.
+
+    usage: cp [flags] source dest
+           cp [flags] source... directory
+
+    flags:
+    -r, -R : copy directories and everything in them
+    -a : like -r, and keep the modes, times and owners
+    --progress : show the files and bytes copied so far, and how fast
+
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output dict: {"output":string,"error":string}
+    '''
+    try:
+        options, params = get_options(parts, "rRa", ["progress"])
+    except CommandError as e:
+        return {"output": None, "error": str(e)}
+    if len(params) < 2:
+        return {"output":None, "error":"cp: missing file operation"}
+
+    progress = TransferProgress("copied") if "progress" in options else None
+    try:
+        errors = copy_paths(params[:-1], params[-1], options, progress)
+    finally:
+        summary = progress.stop() if progress else None
+    return {"output": summary, "error": "\n".join(errors) if errors else None}
+
+
+'''
+copy_paths:
+copies every source to the target of cp
+'''
+def copy_paths(sources, target, options, progress=None):
+    '''
+    copies each source to target, or into it when target is a directory
+    (which it has to be for more than one source). directories need -r or
+    -a and are copied by copy_tree. symlinks are copied as symlinks with -r
+    and -a, and followed otherwise.
+
+    output: list of error messages, one for every path that failed
+    '''
+    recursive = bool(set(options) & {"r", "R", "a"})
+    preserve = "a" in options
+    into = os.path.isdir(target)
+    if len(sources) > 1 and not into:
+        return [f"cp: target '{target}' is not a directory"]
+
+    errors = []
+    for source in sources:
+        dest = os.path.join(target, os.path.basename(source.rstrip("/"))) if into else target
         try:
-            # if the path is a file, delete it
-            if os.path.isfile(path):
-                os.remove(path)
-            # if the path is a directory
-            elif os.path.isdir(path):
-                if "r" in flags:
-                    if "f" not in flags:
-                        user = input(f"Are you sure you want to delete '{path}' and its contents? (y/n) ")
-                        # if ANYTHING but "y" is entered, do nothing
-                        if user.lower() != "y":
-                            continue
-                    # deletion
-                    shutil.rmtree(path)
-                else:
-                    if "f" not in flags:
-                        errors.append(f"rm: cannot remove '{path}': Is a directory")
-            # if the files doesn't exist
+            st = os.lstat(source) if recursive else os.stat(source)
+        except FileNotFoundError:
+            errors.append(f"cp: cannot stat '{source}': No such file or directory")
+            continue
+        except OSError as e:
+            errors.append(f"cp: cannot stat '{source}': {e.strerror}")
+            continue
+        if same_file(source, dest):
+            errors.append(f"cp: '{source}' and '{dest}' are the same file")
+            continue
+        if not stat.S_ISDIR(st.st_mode):
+            try:
+                copy_entry(source, dest, st, preserve, progress)
+            except OSError as e:
+                errors.append(f"cp: cannot copy '{source}': {e.strerror}")
+        elif not recursive:
+            errors.append(f"cp: -r not specified; omitting directory '{source}'")
+        elif (os.path.realpath(dest) + os.sep).startswith(os.path.realpath(source) + os.sep):
+            errors.append(f"cp: cannot copy a directory, '{source}', into itself, '{dest}'")
+        else:
+            errors.extend(copy_tree(source, dest, st, preserve, progress))
+    return errors
+
+
+'''
+copy_tree:
+copies a directory and everything in it
+'''
+def copy_tree(source, dest, st, preserve, progress=None):
+    '''
+    copies the directory source to dest, which is created if it isn't there.
+    walk_parallel reads the source directories on a thread pool and makes
+    the new directories, while a second pool copies the files, a batch of
+    copy_batch_size at a time, so a tree of small files is copied many
+    files at once instead of one after the other. the directories get their
+    modes (and with preserve, their times) last, deepest first, so copying
+    into them doesn't need write permission they won't have or change their
+    times again.
+
+    output: list of error messages
+    '''
+    errors = []
+    # (source, dest, stat) of the directories made, parents before children
+    directories = [(source, dest, st)]
+
+    try:
+        make_dir(dest)
+    except OSError as e:
+        return [f"cp: cannot create directory '{dest}': {e.strerror}"]
+
+    def copy_batch(batch):
+        for path, target, entry_st in batch:
+            try:
+                copy_entry(path, target, entry_st, preserve, progress)
+            except OSError as e:
+                errors.append(f"cp: cannot copy '{path}': {e.strerror}")
+
+    copiers = ThreadPoolExecutor(io_workers)
+    copies = []
+
+    def visit(directory, entries, depth):
+        target = os.path.join(dest, os.path.relpath(directory, source)) if depth else dest
+        subdirectories = []
+        batch = []
+        for entry in entries:
+            path = entry.path
+            try:
+                entry_st = entry.stat(follow_symlinks=False)
+                if stat.S_ISDIR(entry_st.st_mode):
+                    make_dir(os.path.join(target, entry.name))
+                    directories.append((path, os.path.join(target, entry.name), entry_st))
+                    subdirectories.append(path)
+                    continue
+            except OSError as e:
+                errors.append(f"cp: cannot copy '{path}': {e.strerror}")
+                continue
+            batch.append((path, os.path.join(target, entry.name), entry_st))
+            if len(batch) == copy_batch_size:
+                copies.append(copiers.submit(copy_batch, batch))
+                batch = []
+        if batch:
+            copies.append(copiers.submit(copy_batch, batch))
+        return None, subdirectories
+
+    try:
+        for directory, depth, result, error in walk_parallel([source], visit):
+            if error is not None:
+                errors.append(f"cp: cannot access '{directory}': {error.strerror}")
+        for future in copies:
+            future.result()
+    finally:
+        copiers.shutdown()
+
+    for path, target, dir_st in reversed(directories):
+        try:
+            if preserve:
+                keep_metadata(target, dir_st)
             else:
-                if "f" not in flags:
-                    errors.append(f"rm: cannot remove '{path}': No such file or directory")
+                os.chmod(target, stat.S_IMODE(dir_st.st_mode) & ~process_umask)
+        except OSError as e:
+            errors.append(f"cp: cannot set the mode of '{target}': {e.strerror}")
+    return errors
 
-        # display error exception msg
-        except Exception as e:
-            if "f" not in flags:
-                errors.append(f"rm: error removing '{path}': {str(e)}")
-    if errors:
-        error_output = "\n".join(errors)
+
+'''
+same_file:
+tells if two paths are the same file (and both exist)
+'''
+def same_file(path, other):
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        return False
+
+
+'''
+make_dir:
+makes a directory cp can write into, or uses the one already there
+'''
+def make_dir(path):
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        if not os.path.isdir(path):
+            raise
+
+
+'''
+copy_entry:
+copies one file or symlink
+'''
+def copy_entry(source, dest, st, preserve, progress=None):
+    '''
+    copies the file source (with the stat result st) to dest. a symlink is
+    made again pointing to the same place, a regular file is copied with
+    copy_data, and with preserve the mode, times and owner are copied too.
+    raises OSError.
+    '''
+    if stat.S_ISLNK(st.st_mode):
+        link = os.readlink(source)
+        try:
+            os.symlink(link, dest)
+        except FileExistsError:
+            os.unlink(dest)
+            os.symlink(link, dest)
+    elif stat.S_ISREG(st.st_mode):
+        with open(source, "rb") as src:
+            fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IMODE(st.st_mode) & 0o777)
+            try:
+                copy_data(src.fileno(), fd, progress)
+            finally:
+                os.close(fd)
     else:
-        error_output = None
-    return {"output": None, "error": error_output}
- 
+        raise OSError(errno.EINVAL, "not a regular file")
+    if preserve:
+        keep_metadata(dest, st)
+    if progress is not None:
+        progress.file_done()
+
+
+'''
+keep_metadata:
+gives a copy the owner, mode and times of the original (cp -a)
+'''
+def keep_metadata(path, st):
+    is_link = stat.S_ISLNK(st.st_mode)
+    try:
+        os.chown(path, st.st_uid, st.st_gid, follow_symlinks=False)
+    except PermissionError:
+        # only root can give files away; the copy stays ours
+        pass
+    if not is_link:
+        os.chmod(path, stat.S_IMODE(st.st_mode))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=not is_link)
+
+
+'''
+copy_data:
+copies everything from one file descriptor to another inside the kernel
+'''
+def copy_data(in_fd, out_fd, progress=None):
+    '''
+    copies in_fd to out_fd with os.copy_file_range, which never brings the
+    data into python (and can share the blocks on filesystems that support
+    it). where the kernel can't do that (another filesystem on an old
+    kernel, no copy_file_range) it uses os.sendfile, and a pread and write
+    loop as the last resort.
+
+    output: the number of bytes copied
+    '''
+    offset = 0
+    method = "range" if hasattr(os, "copy_file_range") else "send"
+    while True:
+        try:
+            if method == "range":
+                copied = os.copy_file_range(in_fd, out_fd, copy_chunk_size, offset, offset)
+            elif method == "send":
+                copied = os.sendfile(out_fd, in_fd, offset, copy_chunk_size)
+            else:
+                data = os.pread(in_fd, 1024 * 1024, offset)
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(out_fd, view):]
+                copied = len(data)
+        except OSError as e:
+            if method == "read" or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+                raise
+            # the next method writes at the file position, which has to be where this one stopped
+            method = "send" if method == "range" else "read"
+            os.lseek(out_fd, offset, os.SEEK_SET)
+            continue
+        if copied == 0:
+            return offset
+        offset += copied
+        if progress is not None:
+            progress.add(copied)
+
+
+'''
+TransferProgress:
+keeps a running count of a copy on the terminal (cp --progress)
+'''
+class TransferProgress:
+    '''
+    counts the files and bytes a long copy has done. a thread of its own
+    redraws a line on stderr with them and the speed every
+    progress_interval seconds, and stop() clears the line and returns the
+    summary. the counts are safe to add to from several threads.
+    '''
+    def __init__(self, verb):
+        self.verb = verb
+        self.files = 0
+        self.bytes = 0
+        self.start = monotonic()
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.show, daemon=True)
+        self.thread.start()
+
+    def add(self, size):
+        with self.lock:
+            self.bytes += size
+
+    def file_done(self):
+        with self.lock:
+            self.files += 1
+
+    def line(self):
+        seconds = max(monotonic() - self.start, 1e-6)
+        return (f"{self.verb} {self.files} files, {human_size(self.bytes)} in {seconds:.1f}s "
+                f"({human_size(int(self.bytes / seconds))}/s)")
+
+    def show(self):
+        while not self.done.wait(progress_interval):
+            sys.stderr.write("\r\033[K" + self.line())
+            sys.stderr.flush()
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+        sys.stderr.write("\r\033[K")
+        sys.stderr.flush()
+        return self.line()
+
+'''
+rm:
+allows the user to delete a file/directory by passing its name
+'''
+def rm(parts):
+    """
+    removes files or directories.
+
+    flags:
+    -r : recursive (delete directories and their contents)
+    -f : force (ignore errors, no prompts)
+    -v : verbose (say how many files and directories were removed, and how long it took)
+
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output: dict: {"output":string,"error":string}
+    """
+    params = parts.get("params") or []
+    flags = parts.get("flags") or ""
+
+    if not params:
+        return {"output": None, "error": "rm: missing operand"}
+
+    # used as an error message display
+    errors = []
+    removed_files = 0
+    removed_dirs = 0
+    start = monotonic()
+
+    for path in params:
+        try:
+            # if the path is a directory (and not a symlink to one)
+            if os.path.isdir(path) and not os.path.islink(path):
+                if "r" in flags:
+                    if "f" not in flags:
+                        user = input(f"Are you sure you want to delete '{path}' and its contents? (y/n) ")
+                        # if ANYTHING but "y" is entered, do nothing
+                        if user.lower() != "y":
+                            continue
+                    # deletion
+                    files, directories, tree_errors = remove_tree(path)
+                    removed_files += files
+                    removed_dirs += directories
+                    errors.extend(tree_errors)
+                else:
+                    errors.append(f"rm: cannot remove '{path}': Is a directory")
+            # if the path is a file (or a symlink), delete it
+            elif os.path.lexists(path):
+                os.remove(path)
+                removed_files += 1
+            # if the files doesn't exist
+            else:
+                errors.append(f"rm: cannot remove '{path}': No such file or directory")
+
+        # display error exception msg
+        except Exception as e:
+            errors.append(f"rm: error removing '{path}': {str(e)}")
+
+    output = None
+    if "v" in flags:
+        output = f"removed {removed_files} files and {removed_dirs} directories in {monotonic() - start:.2f}s"
+    if errors and "f" not in flags:
+        error_output = "\n".join(errors)
+    else:
+        error_output = None
+    return {"output": output, "error": error_output}
+
+
+'''
+remove_tree:
+deletes a directory and everything in it
+'''
+def remove_tree(path):
+    '''
+    deletes the directory tree at path. walk_parallel reads the directories
+    on a thread pool and every worker unlinks the files of the directory it
+    just read, so the unlinks of many directories run at the same time.
+    once the walk is done the directories are empty and are removed deepest
+    first. symlinks are removed, never followed. a path that can't be
+    removed doesn't stop the rest.
+
+    output: (files removed, directories removed, list of error messages)
+    '''
+    errors = []
+    # the directories read, parents before children
+    directories = []
+
+    def visit(directory, entries, depth):
+        subdirectories = []
+        removed = 0
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                    continue
+                os.unlink(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors.append(f"rm: cannot remove '{entry.path}': {e.strerror}")
+        return removed, subdirectories
+
+    files = 0
+    for directory, depth, removed, error in walk_parallel([path], visit):
+        directories.append(directory)
+        if error is not None:
+            errors.append(f"rm: cannot remove '{directory}': {error.strerror}")
+        else:
+            files += removed
+
+    removed_dirs = 0
+    for directory in reversed(directories):
+        try:
+            os.rmdir(directory)
+            removed_dirs += 1
+        except OSError as e:
+            # a directory that couldn't be read was already reported
+            if e.errno != errno.ENOTEMPTY:
+                errors.append(f"rm: cannot remove '{directory}': {e.strerror}")
+    return files, removed_dirs, errors
+
+
+'''
+cat:
+allows the user to view the contents of a file
+'''
+def cat(parts):
+    '''
+    Displays or cats file contents or piped input, with optional formatting.
+
+    Flags:
+    -n : number all lines
+    -b : number non-empty lines (overrides -n)
+    -s : collapse multiple blank lines into one
+    -v : display non-printing characters with ^ and M- notation (except tabs and newlines)
+    -E : display $ at the end of each line
+    -T : display tabs as ^I
+    -A : same as -vET
+    -e : same as -vE
+    -t : same as -vT
+
+    Input: dict with keys: "input" (str), "cmd" (str), "params" (list), "flags" (str)
+    Output: dict with keys: "output" (str), "error" (str)
+    '''
+    output_file = parts.get("outfile")
+    append_mode = parts.get("append", False)
+
+    # plain cat > file copies the bytes straight across
+    if output_file and plain_cat(parts):
+        try:
+            copy_cat(parts)
+        except CommandError as e:
+            return {"output": None, "error": str(e)}
+        return {"output": None, "error": None}
+
+    result = run_stream(stream_cat, parts)
+    if result["error"]:
+        return result
+    final_output = result["output"].rstrip()
+
+    # Handle output redirection
+    if output_file:
+        try:
+            mode = "a" if append_mode else "w"
+            with open(output_file, mode, encoding="utf-8") as file:
+                file.write(final_output + "\n")
+            return {"output": None, "error": None}
+        except PermissionError:
+            return {"output": None, "error": f"cat: {output_file}: Access denied"}
+        except Exception as err:
+            return {"output": None, "error": f"cat: Error: {str(err)}"}
+
+    return {"output": final_output, "error": None}
+
+
+'''
+stream_cat:
+streaming version of cat used by the pipeline
+'''
+def stream_cat(parts, lines):
+    '''
+    Yields the lines of the files (or of the piped input) one at a time, applying
+    the -s, -v, -b and -n formatting on the fly.
+
+    Input: the command dict and an iterator of piped lines (or None)
+    Output: generator of lines, raises CommandError on a bad file
+    '''
+    arguments = parts.get("params") or []
+    options = parts.get("flags") or ""
+
+    # -A, -e and -t are shorthands
+    if "A" in options:
+        options += "vET"
+    if "e" in options:
+        options += "vE"
+    if "t" in options:
+        options += "vT"
+    # -v, -E and -T work on the raw bytes, so the files are read as bytes
+    show = "v" in options or "E" in options or "T" in options
+
+    # Determine input sources
+    if lines is not None:
+        all_lines = lines
+    else:
+        if not arguments:
+            raise CommandError("cat: No file provided")
+        # without -s the bytes don't have to be split into lines first
+        if show and "s" not in options:
+            all_lines = show_nonprinting(cat_blocks(arguments), "v" in options, "E" in options, "T" in options)
+            show = False
+        else:
+            all_lines = cat_sources(arguments, as_bytes=show)
+
+    # Apply -s flag: reduce multiple blank lines
+    if "s" in options:
+        all_lines = squeeze_blank(all_lines)
+
+    # Apply -v, -E and -T flags: show non-printing characters
+    if show:
+        all_lines = show_nonprinting(line_blocks(all_lines), "v" in options, "E" in options, "T" in options)
+
+    # Apply -b or -n flag: add line numbers
+    if "b" in options:
+        all_lines = number_lines(all_lines, skip_blank=True)
+    elif "n" in options:
+        all_lines = number_lines(all_lines)
+
+    yield from all_lines
+
+
+'''
+open_cat_source:
+opens one of the files given to cat
+'''
+def open_cat_source(source, binary):
+    '''
+    opens the file as bytes, or as utf-8 text with bad bytes replaced, and
+    turns the errors into cat's messages.
+    '''
+    try:
+        if binary:
+            return open(source, "rb")
+        return open(source, "r", encoding="utf-8", errors="replace")
+    except FileNotFoundError:
+        raise CommandError(f"cat: {source}: File not found")
+    except PermissionError:
+        raise CommandError(f"cat: {source}: Access denied")
+    except Exception as err:
+        raise CommandError(f"cat: Error: {str(err)}")
+
+
+'''
+cat_sources:
+reads the files given to cat one after another
+'''
+def cat_sources(sources, as_bytes=False):
+    '''
+    yields the lines of every file in order, only keeping one file open at a time.
+    as_bytes yields the lines as undecoded bytes that keep their newline, so
+    cat -E can tell a last line that doesn't have one.
+    '''
+    for source in sources:
+        with open_cat_source(source, as_bytes) as file:
+            if as_bytes:
+                yield from file
+            else:
+                yield from file_lines(file)
+
+
+'''
+cat_blocks:
+reads the files given to cat as blocks of whole lines
+'''
+def cat_blocks(sources):
+    '''
+    yields the bytes of every file in big blocks that each hold whole lines
+    with their newlines, which is what show_nonprinting works on. the last
+    line of a file always ends a block (without a newline if the file has
+    none there), so files never run into each other.
+    '''
+    for source in sources:
+        with open_cat_source(source, True) as file:
+            # the start of a line that goes on in the next chunk
+            partial = b""
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                data = partial + chunk
+                cut = data.rfind(b"\n")
+                if cut < 0:
+                    partial = data
+                    continue
+                yield data[:cut + 1]
+                partial = data[cut + 1:]
+            if partial:
+                yield partial
+
+
+'''
+line_blocks:
+joins lines into blocks for show_nonprinting
+'''
+def line_blocks(lines):
+    '''
+    joins the lines a batch at a time into blocks of bytes like the ones
+    cat_blocks makes. bytes lines (from cat_sources) still have their
+    newlines; every piped text line ended with one.
+    '''
+    while True:
+        batch = list(islice(lines, pipe_batch_size))
+        if not batch:
+            return
+        if isinstance(batch[0], str):
+            yield ("\n".join(batch) + "\n").encode("utf-8")
+        else:
+            yield b"".join(batch)
+
+
+'''
+plain_cat:
+tells if a command is a cat that only has to copy files
+'''
+def plain_cat(cmd_dict):
+    '''
+    True for cat with files, no piped or < input, and no flags other than
+    -v, -E and -T (and their shorthands): its output is the bytes of the
+    files, changed a byte at a time at most, so it can skip splitting them
+    into lines.
+    '''
+    return ((cmd_dict.get("cmd") or "").lower() == "cat"
+            and set(cmd_dict.get("flags") or "") <= set("vETAet")
+            and bool(cmd_dict.get("params")) and cmd_dict.get("input") is None
+            and not cmd_dict.get("infile"))
+
+
+'''
+copy_cat:
+runs a plain cat by copying the files without reading them into python
+'''
+def copy_cat(cmd_dict):
+    '''
+    copies the files of a plain cat (see plain_cat) to its > or >> file, or
+    to the terminal when there is none. with no flags the kernel copies the
+    data with os.sendfile, so it never passes through python; -v, -E and -T
+    are applied to big chunks of the files with show_bytes. output to the
+    terminal gets a newline at the end if the last file didn't have one, so
+    the prompt starts on its own line.
+
+    raises CommandError on a bad file
+    '''
+    sources = cmd_dict["params"]
+    output_file = cmd_dict.get("outfile")
+    options = cmd_dict.get("flags") or ""
+    show = None
+    if options:
+        nonprinting = bool(set(options) & set("vAet"))
+        ends = bool(set(options) & set("EAe"))
+        tabs = bool(set(options) & set("TAt"))
+        show = lambda data: show_bytes(data, nonprinting, ends, tabs)
+    if output_file is None:
+        sys.stdout.flush()
+        last = copy_files(sources, sys.stdout.fileno(), show)
+        if last not in (b"", b"\n"):
+            os.write(sys.stdout.fileno(), b"\n")
+        return
+
+    # a file copied onto itself would be emptied before it is read
+    for source in sources:
+        try:
+            if os.path.samefile(source, output_file):
+                raise CommandError(f"cat: {source}: input file is output file")
+        except OSError:
+            pass
+    try:
+        out = open(output_file, "ab" if cmd_dict.get("append") else "wb")
+    except PermissionError:
+        raise CommandError(f"cat: {output_file}: Permission denied")
+    except OSError as e:
+        raise CommandError(f"cat: {output_file}: {e.strerror}")
+    with out:
+        copy_files(sources, out.fileno(), show)
+
+
+'''
+copy_files:
+copies whole files onto an open file descriptor
+'''
+def copy_files(sources, out_fd, show=None):
+    '''
+    copies every file in order to out_fd with os.sendfile, falling back on
+    shutil.copyfileobj with a big buffer where sendfile can't be used (an
+    O_APPEND file on older kernels, or a system without sendfile). with a
+    show function, every chunk is passed through it on the way instead.
+
+    output: the last byte written (b"" if nothing was)
+    '''
+    last = b""
+    for source in sources:
+        with open_cat_source(source, True) as f:
+            if show is not None:
+                with open(out_fd, "wb", closefd=False) as out:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        chunk = show(chunk)
+                        out.write(chunk)
+                        last = chunk[-1:]
+                continue
+            offset = 0
+            try:
+                while True:
+                    sent = os.sendfile(out_fd, f.fileno(), offset, 1 << 30)
+                    if sent == 0:
+                        break
+                    offset += sent
+            except (OSError, AttributeError):
+                try:
+                    f.seek(offset)
+                    with open(out_fd, "wb", closefd=False) as out:
+                        shutil.copyfileobj(f, out, 1024 * 1024)
+                except OSError as err:
+                    raise CommandError(f"cat: Error: {str(err)}")
+                offset = f.tell()
+            if offset:
+                last = os.pread(f.fileno(), 1, offset - 1)
+    return last
+
+
+'''
+squeeze_blank:
+drops repeated blank lines (cat -s)
+'''
+def squeeze_blank(lines):
+    '''
+    drops a blank line when the line before it was blank too.
+    '''
+    last_was_blank = False
+    for line in lines:
+        is_blank = not line.strip()
+        if is_blank and last_was_blank:
+            continue
+        yield line
+        last_was_blank = is_blank
+
+
+'''
+show_nonprinting:
+replaces non-printing characters with ^X and M-X notation (cat -v, -E, -T)
+'''
+def show_nonprinting(blocks, nonprinting=True, ends=False, tabs=False):
+    '''
+    turns blocks of lines (see cat_blocks) into printable lines the way gnu
+    cat does (see show_bytes). -E puts a $ where every newline was, so a
+    last line without a newline doesn't get one.
+    '''
+    for block in blocks:
+        block = show_bytes(block, nonprinting, ends, tabs)
+        # after -v every byte is ascii; without it, other bytes are decoded if they can be
+        lines = block.decode("utf-8", errors="replace").split("\n")
+        # the newline at the end of the block ends its last line, it doesn't start another
+        if block.endswith(b"\n"):
+            lines.pop()
+        yield from lines
+
+
+'''
+show_bytes:
+applies cat -v, -E and -T to a piece of a file
+'''
+def show_bytes(data, nonprinting=True, ends=False, tabs=False):
+    '''
+    returns the bytes with every byte swapped for its entry in a 256 entry
+    table (see nonprinting_table), and a $ before every newline with -E.
+    the bytes that change are pulled out with one translate, the text
+    between them with a translate and a split, and the two are zipped back
+    together, so the work stays in c however many bytes change. mostly
+    binary data is simply mapped byte by byte.
+    '''
+    table, unchanged, marks, mark = nonprinting_table(nonprinting, tabs)
+    if mark is not None:
+        changing = data.translate(None, unchanged)
+        if len(changing) * 16 > len(data):
+            data = b"".join(map(table.__getitem__, data))
+        elif changing:
+            # every byte that changes becomes `mark`, so splitting on it leaves the text between them
+            pieces = data.translate(marks).split(mark)
+            last = pieces.pop()
+            data = b"".join(chain.from_iterable(zip(pieces, map(table.__getitem__, changing)))) + last
+    if ends:
+        data = data.replace(b"\n", b"$\n")
+    return data
+
+
+'''
+nonprinting_table:
+builds the replacement table used by show_bytes
+'''
+@lru_cache(maxsize=None)
+def nonprinting_table(nonprinting, tabs):
+    '''
+    returns the table of what every byte turns into, the bytes that stay the
+    same, a translate table that turns every byte that changes into one
+    marker byte, and that marker (None when no byte changes). with -v:
+    control bytes become ^@ to ^_, delete is ^?, and bytes from 128 on get
+    M- in front of the same notation. tabs are only changed by -T (to ^I),
+    and newlines never are, since they end the lines.
+    '''
+    table = [bytes([byte]) for byte in range(256)]
+    if nonprinting:
+        for byte in range(256):
+            low = byte & 0x7F
+            if low < 32:
+                shown = b"^" + bytes([low + 64])
+            elif low == 127:
+                shown = b"^?"
+            else:
+                shown = bytes([low])
+            if byte >= 128:
+                shown = b"M-" + shown
+            if byte not in (9, 10):
+                table[byte] = shown
+    if tabs:
+        table[9] = b"^I"
+    changed = bytes(byte for byte in range(256) if table[byte] != bytes([byte]))
+    unchanged = bytes(byte for byte in range(256) if byte not in changed)
+    if not changed:
+        return table, unchanged, None, None
+    mark = changed[:1]
+    return table, unchanged, bytes.maketrans(changed, mark * len(changed)), mark
+
+
+'''
+number_lines:
+puts a line number in front of each line (cat -n / cat -b)
+'''
+def number_lines(lines, skip_blank=False):
+    '''
+    numbers every line, or only the non-blank ones when skip_blank is set.
+    '''
+    line_counter = 0
+    for line in lines:
+        if skip_blank and not line.strip():
+            yield line
+            continue
+        line_counter += 1
+        yield f"{line_counter:6}  {line.rstrip()}"
+
+
+'''
+mv:
+moves files/directories to a different location and renames files
+'''
+def mv(parts):
+    '''
+    moves or renames a file or directory, or moves several into a directory.
+
+    usage: mv source dest
+           mv source... directory
+
+    a move on the same filesystem is a single atomic rename. a move to
+    another filesystem copies everything (like cp -a, on a thread pool)
+    and then deletes the original.
+
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output dict: {"output":string,"error":string}
+    '''
+    params = parts.get("params") or []
+    if len(params) < 2:
+        return {"output": None, "error": "mv: missing file operand"}
+
+    sources, target = params[:-1], params[-1]
+    into = os.path.isdir(target)
+    if len(sources) > 1 and not into:
+        return {"output": None, "error": f"mv: target '{target}' is not a directory"}
+
+    moved = []
+    errors = []
+    for src in sources:
+        # If target is a directory, append the filename
+        dest = os.path.join(target, os.path.basename(src.rstrip("/"))) if into else target
+        try:
+            try:
+                os.rename(src, dest)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                move_errors = move_across(src, dest)
+                if move_errors:
+                    errors.extend(move_errors)
+                    continue
+            moved.append(f"Moved '{src}' to '{dest}'")
+        except FileNotFoundError:
+            errors.append(f"mv: cannot stat '{src}': No such file or directory")
+        except PermissionError:
+            errors.append(f"mv: cannot move '{src}': Permission denied")
+        except Exception as e:
+            errors.append(f"mv: {str(e)}")
+
+    return {"output": "\n".join(moved) or None, "error": "\n".join(errors) or None}
+
+
+'''
+move_across:
+moves a file or directory to another filesystem
+'''
+def move_across(src, dest):
+    '''
+    copies src to dest with the cp -a engine (copy_tree for a directory),
+    then removes src with the rm engine (remove_tree). if anything fails to
+    copy, src is left where it is.
+
+    output: list of error messages
+    '''
+    st = os.lstat(src)
+    if stat.S_ISDIR(st.st_mode):
+        if os.path.isdir(dest) and os.listdir(dest):
+            return [f"mv: cannot move '{src}' to '{dest}': Directory not empty"]
+        errors = [error.replace("cp:", "mv:", 1) for error in copy_tree(src, dest, st, True)]
+        if errors:
+            return errors
+        files, directories, errors = remove_tree(src)
+        return errors
+    copy_entry(src, dest, st, True)
+    os.unlink(src)
+    return []
+
+
+
+'''changes the permissions of a file 
+what the numbers mean in command ex: 777 
+it grants permission access for a file 
+the [0] = owner
+[1] = group
+[2] = others 
+"0": "---", "1": "--x", "2": "-w-", "3": "-wx",
+"4": "r--", "5": "r-x", "6": "rw-", "7": "rwx"
+the mode can also be symbolic, like u+x,g-w (see mode_changer)
+'''
+def chmod(parts):
+    '''
+    changes the permissions of files.
+
+    usage: chmod [-R] <mode> <filename>...
+
+    the mode is either octal:
+    [0] = owner
+    [1] = group
+    [2] = others 
+    "0": "---", "1": "--x", "2": "-w-", "3": "-wx",
+    "4": "r--", "5": "r-x", "6": "rw-", "7": "rwx"
+
+    or symbolic: who (u, g, o or a), then +, - or =, then the permissions
+    (r, w, x, X for directories and files someone can already run, s, t,
+    or u, g or o to copy those), with commas between parts: u+x,g-w or a=rX
+
+    flags:
+    -R : also change everything inside directories, all the way down
+    '''
+    args = parts.get("args")
+    if args is None:
+        args = (["-" + parts["flags"]] if parts.get("flags") else []) + list(parts.get("params") or [])
+    # not get_options: a mode like -w looks like an option, but it is the mode
+    recursive = "-R" in args or "--recursive" in args
+    params = [arg for arg in args if arg not in ("-R", "--recursive")]
+
+    if len(params) < 2:
+        return{"output":None, "error": "chmod:missing operand \n usage: chmod [-R] <mode> <filename>..."}
+
+    mode_str, filenames = params[0], params[1:]
+
+    try:
+        change = mode_changer(mode_str)
+    except ValueError:
+        return {"output":None, "error": f"chmod invalid mode:'{mode_str}'"}
+
+    output = []
+    errors = []
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+            change_mode(filename, st, change)
+            if recursive and stat.S_ISDIR(st.st_mode):
+                changed, total, tree_errors = change_tree(filename, change)
+                errors.extend(tree_errors)
+                output.append(f"permission of '{filename}' and everything in it changed to {mode_str} "
+                              f"({changed} of {total} changed)")
+            else:
+                output.append(f"permission of '{filename}' changed to {mode_str}")
+
+        except FileNotFoundError:
+            errors.append(f"chmod: there no such file '{filename}'")
+
+        except PermissionError:
+            errors.append(f"chmod: changing permissions of '{filename}': Permission denied")
+
+        except Exception as e:
+            errors.append(f"chmod: {str(e)}")
+
+    return {"output": "\n".join(output) or None, "error": "\n".join(errors) or None}
+
+
+'''
+change_tree:
+changes the permissions of everything inside a directory (chmod -R)
+'''
+def change_tree(directory, change):
+    '''
+    walks the directory with walk_parallel, and every worker changes the
+    entries of the directory it just read. the mode of each entry comes
+    with the scandir entry, so entries that already have the new mode cost
+    no system call at all. symlinks are skipped, not followed.
+
+    output: (entries changed, entries looked at, list of error messages)
+    '''
+    errors = []
+
+    def visit(path, entries, depth):
+        subdirectories = []
+        changed = 0
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+                if stat.S_ISLNK(st.st_mode):
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    subdirectories.append(entry.path)
+                changed += change_mode(entry.path, st, change)
+            except OSError as e:
+                errors.append(f"chmod: changing permissions of '{entry.path}': {e.strerror}")
+        return (changed, len(entries)), subdirectories
+
+    changed = 0
+    total = 0
+    for path, depth, counts, error in walk_parallel([directory], visit):
+        if error is not None:
+            errors.append(f"chmod: cannot read directory '{path}': {error.strerror}")
+        else:
+            changed += counts[0]
+            total += counts[1]
+    return changed, total, errors
+
+
+'''
+change_mode:
+changes the permissions of one file, if they aren't what they should be already
+'''
+def change_mode(path, st, change):
+    old = stat.S_IMODE(st.st_mode)
+    new = change(old, stat.S_ISDIR(st.st_mode))
+    if new == old:
+        return False
+    os.chmod(path, new)
+    return True
+
+
+'''
+mode_changer:
+turns a chmod mode into a function that computes the new mode
+'''
+def mode_changer(mode_str):
+    '''
+    returns change(mode, is_dir), which gives the new permission bits for a
+    file with the permission bits mode. an octal mode (755) just replaces
+    them. a symbolic one (u+x,g-w, a=rX, go=u) applies its parts in order,
+    like chmod(1); without u, g, o or a it works on all three but leaves
+    the bits the umask turns off alone. raises ValueError on a bad mode.
+    '''
+    if re.fullmatch(r"[0-7]{1,4}", mode_str):
+        value = int(mode_str, 8)
+        return lambda mode, is_dir: value
+
+    clauses = []
+    for clause in mode_str.split(","):
+        match = re.fullmatch(r"([ugoa]*)((?:[-+=](?:[rwxXst]*|[ugo]))+)", clause)
+        if match is None:
+            raise ValueError(mode_str)
+        clauses.append((match.group(1), re.findall(r"([-+=])([ugo]|[rwxXst]*)", match.group(2))))
+
+    # the bits each class of user owns (their special bit included), and the bits of each permission
+    who_bits = {"u": 0o4700, "g": 0o2070, "o": 0o1007}
+    perm_bits = {"r": 0o444, "w": 0o222, "x": 0o111, "s": 0o6000, "t": 0o1000}
+    shifts = {"u": 6, "g": 3, "o": 0}
+
+    def change(mode, is_dir):
+        for who, actions in clauses:
+            mask = 0
+            for name in who.replace("a", "ugo") or "ugo":
+                mask |= who_bits[name]
+            for op, perms in actions:
+                if perms in shifts:
+                    # copies the permissions of another class (g=u)
+                    bits = ((mode >> shifts[perms]) & 7) * 0o111
+                else:
+                    bits = 0
+                    for perm in perms:
+                        if perm == "X":
+                            if is_dir or mode & 0o111:
+                                bits |= 0o111
+                        else:
+                            bits |= perm_bits[perm]
+                bits &= mask
+                if not who:
+                    bits &= ~process_umask
+                if op == "+":
+                    mode |= bits
+                elif op == "-":
+                    mode &= ~bits
+                else:
+                    # directories keep their set-id bits unless they are set or cleared by name
+                    cleared = mask & ~0o6000 if is_dir else mask
+                    mode = (mode & ~cleared) | bits
+        return mode
+
+    return change
+
+'''
+wc
+counts the total number of words/lines in a file or piped input
+'''
+def wc(parts):
+    '''
+    Counts lines, words, bytes, and/or characters in files or piped input.
+
+    Flags:
+    -l : count lines
+    -w : count words
+    -c : count bytes
+    -m : count characters (overrides -c if specified)
+
+    Input: dict with keys: {"input" (str), "cmd" (str), "params" (list), "flags" (str)}
+    Output: dict with keys: "output" (str), "error" (str)
+    '''
+    return run_stream(stream_wc, parts)
+
+
+'''
+stream_wc:
+streaming version of wc used by the pipeline
+'''
+def stream_wc(parts, lines):
+    '''
+    counts every file (or the piped input) in one pass over fixed-size chunks
+    (see wc_counts), so memory stays the same no matter how big the file is.
+    only what the flags ask for is counted: wc -l just counts newlines.
+
+    input: the command dict and an iterator of piped lines (or None)
+    output: generator of result lines, raises CommandError on a bad file
+    '''
+    options, arguments = get_options(parts, "lwcm")
+
+    # Decide what to count based on flags or default behavior
+    show_lines = "l" in options or not options
+    show_words = "w" in options or not options
+    show_bytes = "c" in options or not options
+    show_chars = "m" in options
+    if show_chars and "c" in options:
+        show_bytes = False  # -m takes precedence over -c
+
+    # Determine input sources
+    sources = arguments if arguments else []
+    if lines is not None:
+        sources = ["<stdin>"]  # Handle piped input
+
+    overall_lines = 0
+    overall_words = 0
+    overall_bytes = 0
+    overall_chars = 0
+    results = []
+
+    if lines is not None:
+        all_counts = [wc_counts(line_chunks(lines), show_words, show_chars)]
+    else:
+        all_counts = wc_files(sources, show_words, show_chars)
+
+    for source, counts in zip(sources, all_counts):
+        line_total, word_total, byte_total, char_total = counts
+
+        # Accumulate totals for multiple files
+        overall_lines += line_total
+        overall_words += word_total
+        overall_bytes += byte_total
+        overall_chars += char_total
+
+        # Build output for this source
+        counts = []
+        if show_lines:
+            counts.append(f"{line_total:8}")
+        if show_words:
+            counts.append(f"{word_total:8}")
+        if show_chars:
+            counts.append(f"{char_total:8}")
+        if show_bytes:
+            counts.append(f"{byte_total:8}")
+        if source != "<stdin>":
+            counts.append(source)
+        results.append(" ".join(counts))
+
+    # Add totals if multiple files
+    if len(sources) > 1:
+        total_counts = []
+        if show_lines:
+            total_counts.append(f"{overall_lines:8}")
+        if show_words:
+            total_counts.append(f"{overall_words:8}")
+        if show_chars:
+            total_counts.append(f"{overall_chars:8}")
+        if show_bytes:
+            total_counts.append(f"{overall_bytes:8}")
+        total_counts.append("total")
+        results.append(" ".join(total_counts))
+
+    # the output has always been stripped, which drops the padding of the first line
+    if results:
+        yield from "\n".join(results).strip().split("\n")
+
+
+'''
+wc_files:
+counts several files at once
+'''
+def wc_files(sources, words, chars):
+    '''
+    counts the files in a thread pool (the reads overlap, and numpy lets go of
+    the gil while it counts) and returns their counts in the order given.
+    counts of files that haven't changed since the last time come from
+    wc_cache instead, so running wc again on the same files is nearly free.
+    '''
+    if len(sources) < 2:
+        results = [wc_file(source, words, chars) for source in sources]
+    else:
+        with ThreadPoolExecutor(min(io_workers, len(sources))) as pool:
+            results = list(pool.map(lambda source: wc_file(source, words, chars), sources))
+    wc_cache.save()
+    return results
+
+
+'''
+wc_file:
+counts one file, or takes its counts from the cache
+'''
+def wc_file(source, words, chars):
+    '''
+    returns the (lines, words, bytes, chars) of a file. the cache keeps words
+    and chars as None when they weren't counted, so wc -l stays a newline count;
+    counts already cached for the same version of the file are kept.
+    '''
+    try:
+        with open(source, "rb") as file:
+            st = os.fstat(file.fileno())
+            # only regular files keep their contents until their mtime changes
+            cached = wc_cache.get(st) if stat.S_ISREG(st.st_mode) else None
+            if cached is not None and (cached[1] is not None or not words) and (cached[3] is not None or not chars):
+                return tuple(count or 0 for count in cached)
+            counts = wc_counts(iter(lambda: file.read(wc_chunk_size), b""), words, chars)
+    except FileNotFoundError:
+        raise CommandError(f"word_count: {source}: File not found")
+    except PermissionError:
+        raise CommandError(f"word_count: {source}: Access denied")
+    except Exception as err:
+        raise CommandError(f"word_count: Error: {str(err)}")
+    if stat.S_ISREG(st.st_mode):
+        line_total, word_total, byte_total, char_total = counts
+        entry = [line_total, word_total if words else None, byte_total, char_total if chars else None]
+        # the cached entry is for this same mtime and size, so what it counted still holds
+        if cached is not None:
+            entry = [count if count is not None else old for count, old in zip(entry, cached)]
+        wc_cache.put(st, entry)
+    return counts
+
+
+'''
+wc_counts:
+counts lines, words, bytes and characters over chunks of bytes
+'''
+def wc_counts(chunks, words=True, chars=True):
+    '''
+    counts in a single pass over an iterable of byte chunks, holding only one
+    chunk at a time. a word that runs over the edge of a chunk is counted once:
+    in_word remembers whether the last chunk ended inside a word. characters
+    are the bytes that don't continue a utf-8 sequence. with numpy installed
+    words and characters are counted by wc_numpy_counts instead.
+
+    output: (lines, words, bytes, chars), where the last line counts even
+    without a newline at the end, like before
+    '''
+    line_total = word_total = byte_total = char_total = 0
+    in_word = False
+    last = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        line_total += chunk.count(b"\n")
+        byte_total += len(chunk)
+        if numpy is not None and (words or chars):
+            chunk_words, chunk_chars, in_word = wc_numpy_counts(chunk, in_word)
+            word_total += chunk_words
+            char_total += chunk_chars
+        else:
+            if words:
+                word_total += len(chunk.split())
+                # the first word goes on from the end of the last chunk
+                if in_word and not chunk[:1].isspace():
+                    word_total -= 1
+                in_word = not chunk[-1:].isspace()
+            if chars:
+                char_total += len(chunk.translate(None, utf8_continuation))
+        last = chunk
+    if last and not last.endswith(b"\n"):
+        line_total += 1
+    return line_total, word_total, byte_total, char_total
+
+
+'''
+wc_numpy_counts:
+counts the words and characters of a chunk with numpy
+'''
+def wc_numpy_counts(chunk, in_word):
+    '''
+    the vectorized kernel of wc_counts. a word starts at every byte that isn't
+    whitespace but comes after one that is (or after the end of the last chunk
+    when that wasn't inside a word).
+
+    output: (words, chars, whether the chunk ends inside a word)
+    '''
+    data = numpy.frombuffer(chunk, dtype=numpy.uint8)
+    word_bytes = ~wc_space_table()[data]
+    starts = numpy.count_nonzero(word_bytes[1:] & ~word_bytes[:-1])
+    if word_bytes[0] and not in_word:
+        starts += 1
+    chars = numpy.count_nonzero((data & 0xC0) != 0x80)
+    return int(starts), int(chars), bool(word_bytes[-1])
+
+
+'''
+wc_space_table:
+the whitespace lookup table for wc_numpy_counts
+'''
+@lru_cache(maxsize=None)
+def wc_space_table():
+    '''
+    returns a 256 entry numpy table that is True for the bytes bytes.split()
+    treats as whitespace, so both kernels count the same words.
+    '''
+    return numpy.array([bytes([i]).isspace() for i in range(256)], dtype=bool)
+
+
+'''
+line_chunks:
+turns piped lines back into chunks of bytes
+'''
+def line_chunks(lines):
+    '''
+    encodes the piped lines a batch at a time, joined by newlines with no
+    newline after the last one (the same text the old string input had).
+    '''
+    first = True
+    while True:
+        batch = list(islice(lines, pipe_batch_size))
+        if not batch:
+            return
+        text = "\n".join(batch)
+        yield (text if first else "\n" + text).encode("utf-8")
+        first = False
+
+'''
+sort:
+sorts the contents of a file(s) in ASCII order
+'''
+def sort(parts):
+    '''
+    sorts the contents of a file(s) in ASCII order.
+
+    flags:
+    -r : reverse the order
+    -n : compare by the number at the start of the line (or key)
+    -u : only print the first of lines with equal keys
+    -k N[,M] : sort by field N (through field M, or the end of the line)
+    -t SEP : fields are separated by SEP instead of blanks
+    -S SIZE : memory to use before spilling sorted runs to disk (like 64M, 1G)
+    --parallel=N : sort runs in N worker processes, then merge them
+
+    with no file, sort sorts its piped input.
+    '''
+    return run_stream(stream_sort, parts)
+
+
+'''
+stream_sort:
+streaming version of sort used by the pipeline
+'''
+def stream_sort(parts, lines):
+    '''
+    sorts the lines of the files (or the piped input when no file is given)
+    with an external merge sort (see external_sort), so input bigger than
+    memory can be sorted, and yields the sorted lines.
+
+    input: the command dict and an iterator of piped lines (or None)
+    output: generator of lines, raises CommandError on a bad file or option
+    '''
+    options, params = get_options(parts, "rnuk:t:S:", ["buffer-size=", "parallel="])
+    if params:
+        source = sort_sources(params)
+    elif lines is not None:
+        # strip piped lines the same way as lines read from a file
+        source = (line.strip() for line in lines)
+    else:
+        raise CommandError("sort:missing file operand")
+
+    # builds the key up front, so a bad -k is reported before reading anything
+    key = sort_key(options)
+    budget = parse_size(options.get("S") or options.get("buffer-size"), sort_buffer_size)
+    if budget is None:
+        raise CommandError(f"sort: invalid buffer size: '{options.get('S') or options.get('buffer-size')}'")
+    try:
+        workers = int(options["parallel"]) if "parallel" in options else 1
+        if workers < 1:
+            raise ValueError
+    except ValueError:
+        raise CommandError(f"sort: invalid number of threads: '{options['parallel']}'")
+
+    sorted_lines = external_sort(source, options, budget, workers)
+    if "u" in options:
+        sorted_lines = unique_by_key(sorted_lines, key)
+    yield from sorted_lines
+
+
+'''
+sort_sources:
+reads the lines of every file given to sort
+'''
+def sort_sources(filenames):
+    '''
+    yields the lines of each file in turn, stripped the way sort always has.
+    '''
+    for filename in filenames:
+        try:
+            f = open(filename, "r", encoding ="utf-8", errors="replace")
+        except FileNotFoundError:
+            raise CommandError(f"sort: {filename}: no such file exists")
+        except PermissionError:
+            raise CommandError(f"sort:{filename}: permisiion denied")
+        except IsADirectoryError:
+            raise CommandError(f"sort: read failed: {filename}: Is a directory")
+        with f:
+            for line in f:
+                yield line.strip()
+
+
+'''
+sort_key:
+builds the key function for sort's -k, -t, -n and -u options
+'''
+def sort_key(options):
+    '''
+    returns the function that turns a line into the value it is sorted by. the
+    sorts call it once per line (not once per comparison), so all the field
+    splitting and number parsing happens only once for every line.
+
+    like gnu sort, lines with equal keys fall back to comparing the whole line,
+    except with -u, where lines with equal keys count as the same line.
+    raises CommandError on a bad -k value.
+    '''
+    separator = options.get("t") or None
+    fields = None
+    if "k" in options:
+        try:
+            first, _, last = options["k"].partition(",")
+            fields = (int(first), int(last) if last else None)
+            if fields[0] < 1 or (fields[1] is not None and fields[1] < fields[0]):
+                raise ValueError
+        except ValueError:
+            raise CommandError(f"sort: invalid key: '{options['k']}'")
+
+    def field_text(line):
+        if fields is None:
+            return line
+        columns = line.split(separator)
+        return (separator or " ").join(columns[fields[0] - 1:fields[1]])
+
+    if "n" in options:
+        def primary(line):
+            number = sort_number.match(field_text(line))
+            return float(number.group()) if number else 0.0
+    elif fields is not None:
+        primary = field_text
+    else:
+        # plain sort: the line is its own key
+        return lambda line: line
+
+    if "u" in options:
+        return primary
+    return lambda line: (primary(line), line)
+
+
+'''
+parse_size:
+reads a size like 512K, 64M or 2G
+'''
+def parse_size(text, default):
+    '''
+    turns a size with an optional K, M or G suffix into bytes. returns the
+    default when no size is given and None when the size can't be read.
+    '''
+    if not text:
+        return default
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    scale = units.get(text[-1].upper(), 1)
+    digits = text[:-1] if text[-1].upper() in units else text
+    try:
+        size = int(float(digits) * scale)
+    except ValueError:
+        return None
+    return size if size > 0 else None
+
+
+'''
+external_sort:
+sorts any number of lines using a fixed amount of memory
+'''
+def external_sort(lines, options, budget, workers=1):
+    '''
+    sorts runs of lines that fit in `budget` bytes in memory, spills each sorted
+    run to a temporary file, and k-way merges the runs with heapq.merge while
+    yielding the result. input that fits in one run never touches the disk.
+
+    with workers > 1 the budget is split between that many smaller runs, which
+    are sorted side by side in a process pool (see sort_run) while the next
+    runs are being read. options are sort's options, which the workers use to
+    build the same key function (see sort_key).
+    '''
+    key = sort_key(options)
+    reverse = "r" in options
+    run_budget = budget // workers
+    runs = []
+    pool = None
+    pending = deque()
+    directory = None
+    try:
+        run = []
+        used = 0
+        for line in lines:
+            run.append(line)
+            # the size of the string object plus its slot in the list
+            used += sys.getsizeof(line) + 8
+            if used < run_budget:
+                continue
+            if workers > 1:
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                    directory = tempfile.mkdtemp(prefix="sort-")
+                pending.append(pool.submit(sort_run, (run, options, directory)))
+                # only keeps as many runs in flight as there are workers
+                if len(pending) >= workers:
+                    runs.append(open_run(pending.popleft().result()))
+            else:
+                runs.append(spill_run(sorted(run, key=key, reverse=reverse)))
+            run = []
+            used = 0
+        while pending:
+            runs.append(open_run(pending.popleft().result()))
+
+        run.sort(key=key, reverse=reverse)
+        if not runs:
+            yield from run
+            return
+        if run:
+            runs.append(spill_run(run))
+        del run
+
+        # merging too many files at once would run out of file handles, so the
+        # runs are first merged in groups into fewer, longer runs
+        while len(runs) > sort_merge_fan_in:
+            group = runs[:sort_merge_fan_in]
+            merged = spill_run(heapq.merge(*[read_run(f) for f in group], key=key, reverse=reverse))
+            for f in group:
+                f.close()
+            runs = runs[sort_merge_fan_in:] + [merged]
+
+        yield from heapq.merge(*[read_run(f) for f in runs], key=key, reverse=reverse)
+    finally:
+        for f in runs:
+            f.close()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+'''
+sort_run:
+sorts one run of lines in a worker process
+'''
+def sort_run(job):
+    '''
+    the function the process pool runs for sort --parallel: sorts a run of
+    lines and writes it to a file in the given directory. returns the path,
+    since an open file can't be sent back to the shell.
+    '''
+    lines, options, directory = job
+    lines.sort(key=sort_key(options), reverse="r" in options)
+    fd, path = tempfile.mkstemp(dir=directory, prefix="run-")
+    with open(fd, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+    return path
+
+
+'''
+open_run:
+opens a run written by a worker process
+'''
+def open_run(path):
+    '''
+    opens a sorted run file and removes its name right away, so the file
+    goes away by itself once it is closed (like spill_run's files).
+    '''
+    f = open(path, "r", encoding="utf-8")
+    os.remove(path)
+    return f
+
+
+'''
+spill_run:
+writes a sorted run to a temporary file
+'''
+def spill_run(lines):
+    '''
+    writes the lines to an anonymous temporary file (removed when it is closed)
+    and returns the open file.
+    '''
+    f = tempfile.TemporaryFile("w+", encoding="utf-8")
+    for line in lines:
+        f.write(line + "\n")
+    return f
+
+
+'''
+read_run:
+reads a sorted run back from its temporary file
+'''
+def read_run(f):
+    '''
+    yields the lines of a spilled run from the start of the file.
+    '''
+    f.seek(0)
+    yield from file_lines(f)
+
+
+'''
+unique_by_key:
+drops lines whose key equals the one before (sort -u)
+'''
+def unique_by_key(lines, key):
+    '''
+    yields the first line of every run of lines with the same key.
+    '''
+    last = object()
+    for line in lines:
+        current = key(line)
+        if current != last:
+            yield line
+            last = current
+
+'''
+less:
+allows the user to only see snippets of files
+'''
+def less(parts):
+    '''
+    Shows a file's contents page by page, with optional line count and line numbers.
+    Only the lines on the screen are read, so big files open right away.
+
+    Flags:
+    -N : show line numbers
+
+    Keys:
+    space, enter : next page
+    b : previous page
+    g, G : first page, last page
+    /pattern : jump to the next line matching the pattern (n: the one after)
+    q : quit
+
+    with no file, less pages through its piped input.
+    '''
+    return run_stream(stream_less, parts)
+
+
+'''
+stream_less:
+the pager, as a pipeline stage
+'''
+def stream_less(parts, lines):
+    '''
+    pages through a file through a LineIndex over an mmap of it, so jumping
+    anywhere only reads the page that is shown (plus a quick newline count
+    the first time the index gets that far). piped input is spilled to a
+    temporary file (see SpillFile) only as far as the pages shown need.
+    the pages are printed straight to the terminal; nothing is passed on.
+    '''
+    params = parts.get("params") or []
+    flags = parts.get("flags") or ""
+    show_numbers = "N" in flags
+
+    # Default to 10 lines per page
+    lines_per_page = 10
+    file_name = None
+
+    # Find file name and line count
+    for param in params:
+        if param.isdigit():
+            lines_per_page = int(param)  # Set custom line count
+            if lines_per_page <= 0:
+                raise CommandError("less: Line count must be positive")
+        else:
+            file_name = param  # Set file name
+
+    if lines is not None and not file_name:
+        spill = SpillFile(lines)
+        try:
+            page(LineIndex(b"", grow=spill.grow), lines_per_page, show_numbers)
+        finally:
+            spill.close()
+        yield from ()
+        return
+
+    if not file_name:
+        raise CommandError("less: No file given")
+
+    try:
+        file = open(file_name, "rb")
+    except FileNotFoundError:
+        raise CommandError(f"less: {file_name}: File not found")
+    except PermissionError:
+        raise CommandError(f"less: {file_name}: Access denied")
+    except Exception as e:
+        raise CommandError(f"less: Error: {str(e)}")
+    with file:
+        # an empty file can't be mapped, and has nothing to page through anyway
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        st = os.fstat(file.fileno())
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # starts from the saved index of the file, and saves how far it got
+            line_index = open_line_index(file_name, data, st)
+            try:
+                page(line_index, lines_per_page, show_numbers)
+            finally:
+                save_line_index(line_index, file_name, st)
+    yield from ()
+
+
+'''
+page:
+the key loop of less
+'''
+def page(index, lines_per_page, show_numbers):
+    '''
+    shows the page starting at line `top` and waits for a key. moving on by
+    one page just prints the next page under the last one; any other jump
+    clears the screen first. at the end of the file the prompt says (END),
+    and space, enter or q leave.
+    '''
+    top = 0
+    regex = None
+    shown = show_page(index, top, lines_per_page, show_numbers)
+    while True:
+        at_end = index.line_offset(top + shown) is None
+        sys.stdout.write("(END)" if at_end else "--More-- (space: next page, b: back, g/G: top/end, /: search, q: quit)")
+        sys.stdout.flush()
+
+        # Use getch to get a single key
+        key = Getch()()
+
+        # Clear the prompt
+        sys.stdout.write("\r\033[K")
+        sys.stdout.flush()
+
+        # Handle user input
+        if key.lower() == "q" or (at_end and key in (" ", "\r")):
+            return
+        if key in (" ", "\r"):
+            top += lines_per_page  # Move to next page
+            shown = show_page(index, top, lines_per_page, show_numbers)
+            continue
+        if key == "b":
+            new_top = max(top - lines_per_page, 0)
+        elif key == "g":
+            new_top = 0
+        elif key == "G":
+            new_top = max(index.line_count() - lines_per_page, 0)
+        elif key in ("/", "n"):
+            if key == "/":
+                pattern = read_pattern()
+                if not pattern:
+                    continue
+                try:
+                    regex = compile_pattern((pattern,), False, True, False, True)
+                except re.error:
+                    sys.stdout.write(f"less: bad pattern: {pattern}")
+                    continue
+            if regex is None:
+                continue
+            found = index.search(regex, top + 1)
+            if found is None:
+                sys.stdout.write("Pattern not found ")
+                continue
+            new_top = found
+        else:
+            # Ignore other keys and loop again
+            continue
+        top = new_top
+        sys.stdout.write("\033[2J\033[H")
+        shown = show_page(index, top, lines_per_page, show_numbers)
+
+
+'''
+show_page:
+prints one page of less
+'''
+def show_page(index, top, count, show_numbers):
+    '''
+    prints up to count lines from line `top` on and returns how many there were.
+    '''
+    shown = 0
+    for i, line in enumerate(index.lines_from(top, count), start=top + 1):
+        text = line.decode("utf-8", errors="replace")
+        if show_numbers:
+            sys.stdout.write(f"{i:4} {text}\n")  # Show line number
+        else:
+            sys.stdout.write(text + "\n")
+        shown += 1
+    sys.stdout.flush()
+    return shown
+
+
+'''
+read_pattern:
+reads the pattern typed after / in less
+'''
+def read_pattern():
+    '''
+    echoes the keys typed after / until enter, and returns them. backspace
+    works; escape gives up and returns an empty pattern.
+    '''
+    sys.stdout.write("/")
+    sys.stdout.flush()
+    getch = Getch()
+    pattern = ""
+    while True:
+        char = getch()
+        if char in ("\r", "\n"):
+            break
+        if char == "\x1b":
+            pattern = ""
+            break
+        if char in ("\x7f", "\b"):
+            if pattern:
+                pattern = pattern[:-1]
+                sys.stdout.write("\b \b")
+        else:
+            pattern += char
+            sys.stdout.write(char)
+        sys.stdout.flush()
+    sys.stdout.write("\r\033[K")
+    return pattern
+
+
+'''
+LineIndex:
+finds where lines start in a big file without reading all of it
+'''
+class LineIndex:
+    '''
+    a sparse index of where lines start: the byte offset of every
+    `every`th line is kept in an array('Q'), filled in only as far as
+    somebody has asked. getting to line n is a lookup plus at most `every`
+    finds, instead of a scan from the top. the data is anything that slices
+    like bytes (normally an mmap). data that can grow (piped input being
+    spilled, see SpillFile) comes with `grow`, which returns the data with
+    more in it, or None once there is no more.
+    '''
+    def __init__(self, data, every=None, grow=None):
+        self.data = data
+        self.every = every or line_index_every
+        self.grow = grow
+        # offsets[i] is where line i * every starts
+        self.offsets = array("Q", [0])
+        # how far the data has been counted, and the newlines before that
+        self.scanned = 0
+        self.lines = 0
+        # the end of the data has been reached (and there's no more to grow)
+        self.complete = False
+        # how far a saved index had got (see open_line_index)
+        self.loaded = 0
+
+    def scan(self, until_line=None, until_offset=None):
+        '''
+        counts on into the data until there are more than until_line
+        newlines, or until until_offset is passed, or until the data ends.
+        it counts 4 KB at a time with bytes.count, and only looks for single
+        newlines in the blocks where a checkpoint falls.
+        '''
+        while not self.complete:
+            if until_line is not None and self.lines > until_line:
+                return
+            if until_offset is not None and self.scanned > until_offset:
+                return
+            if self.scanned >= len(self.data):
+                data = self.grow() if self.grow is not None else None
+                if data is None:
+                    self.complete = True
+                    return
+                self.data = data
+                continue
+            end = min(self.scanned + 4096, len(self.data))
+            block = self.data[self.scanned:end]
+            count = block.count(b"\n")
+            # the next checkpoint starts after this newline of the block
+            target = len(self.offsets) * self.every - self.lines
+            position, seen = 0, 0
+            while target <= count:
+                while seen < target:
+                    position = block.find(b"\n", position) + 1
+                    seen += 1
+                self.offsets.append(self.scanned + position)
+                target += self.every
+            self.scanned = end
+            self.lines += count
+
+    def line_offset(self, n):
+        '''
+        returns where line n (counting from 0) starts, or None past the end.
+        '''
+        self.scan(until_line=n)
+        if n > self.lines:
+            return None
+        offset = self.offsets[n // self.every]
+        for _ in range(n % self.every):
+            offset = self.data.find(b"\n", offset) + 1
+        # the last newline of the data doesn't start another line
+        if offset >= len(self.data):
+            self.scan(until_offset=offset)
+            if offset >= len(self.data):
+                return None
+        return offset
+
+    def lines_from(self, n, count):
+        '''
+        yields up to count lines from line n on, as bytes without the newline.
+        '''
+        offset = self.line_offset(n)
+        if offset is None:
+            return
+        # makes sure all of the lines are in the data
+        self.scan(until_line=n + count)
+        for _ in range(count):
+            if offset >= len(self.data):
+                return
+            end = self.data.find(b"\n", offset)
+            if end < 0:
+                end = len(self.data)
+            yield self.data[offset:end]
+            offset = end + 1
+
+    def line_count(self):
+        '''
+        returns how many lines there are (this counts to the end once).
+        '''
+        self.scan()
+        if len(self.data) and self.data[-1:] != b"\n":
+            return self.lines + 1
+        return self.lines
+
+    def line_of(self, offset):
+        '''
+        returns the number of the line the byte at offset is in.
+        '''
+        self.scan(until_offset=offset)
+        i = bisect_right(self.offsets, offset) - 1
+        return i * self.every + self.data[self.offsets[i]:offset].count(b"\n")
+
+    def search(self, regex, n):
+        '''
+        returns the number of the first line from line n on that the bytes
+        regex matches, or None. the regex runs over the data itself, starting
+        at line n.
+        '''
+        start = self.line_offset(n)
+        if start is None:
+            return None
+        # piped input has to be all there before it can be searched
+        self.scan()
+        match = regex.search(self.data, start)
+        if match is None:
+            return None
+        return self.line_of(match.start())
+
+
+'''
+SpillFile:
+keeps piped input in a temporary file so it can be paged through
+'''
+class SpillFile:
+    '''
+    writes piped lines to a temporary file a batch at a time, only when the
+    reader asks for more (see LineIndex), and maps the file for reading.
+    '''
+    def __init__(self, lines):
+        self.lines = lines
+        self.file = tempfile.TemporaryFile()
+        self.map = None
+
+    def grow(self):
+        '''
+        adds the next batch of lines and returns the new mapping, or None
+        when the input has ended.
+        '''
+        batch = list(islice(self.lines, 4 * pipe_batch_size))
+        if not batch:
+            return None
+        self.file.write(("\n".join(batch) + "\n").encode("utf-8"))
+        self.file.flush()
+        # the reader moves on to the new mapping, so the old one can go
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+'''
+index_dir:
+returns the directory the saved line indexes are kept in
+'''
+def index_dir():
+    path = os.path.join(cache_dir(), "index")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+'''
+index_path:
+returns where the line index of a file is saved
+'''
+def index_path(st):
+    # the device and inode stay the same when the file is renamed
+    return os.path.join(index_dir(), f"{st.st_dev}-{st.st_ino}.idx")
+
+
+'''
+open_line_index:
+returns a LineIndex for a file, picking up a saved one when it is still good
+'''
+def open_line_index(filename, data, st):
+    '''
+    makes a LineIndex over the mapped file. if the file has a saved index
+    (see save_line_index) from when it had the same mtime and size, the
+    index starts from there, so a line that was found before is a lookup
+    instead of a scan. a saved index that doesn't match is ignored, and is
+    replaced the next time this file's index is saved.
+    '''
+    index = LineIndex(data)
+    try:
+        with open(index_path(st), "rb") as f:
+            header = json.loads(f.readline())
+            if [header["mtime_ns"], header["size"], header["every"]] != [st.st_mtime_ns, st.st_size, index.every]:
+                return index
+            offsets = array("Q")
+            offsets.frombytes(f.read())
+        # marks the index as recently used (see evict_indexes)
+        os.utime(index_path(st))
+    except (OSError, ValueError, KeyError):
+        return index
+    index.offsets = offsets
+    index.scanned = header["scanned"]
+    index.lines = header["lines"]
+    index.complete = header["complete"]
+    index.loaded = index.scanned
+    return index
+
+
+'''
+save_line_index:
+saves how far a LineIndex got, so the next command can start from there
+'''
+def save_line_index(index, filename, st, force=False):
+    '''
+    writes the index next to the other caches if it got further than the
+    saved one. indexes of small files aren't worth keeping unless force is
+    set (the index builtin), and files changed very recently are skipped
+    (see mtime_is_settled).
+    '''
+    if index.scanned <= index.loaded and not force:
+        return
+    if st.st_size < index_min_file_size and not force:
+        return
+    if not mtime_is_settled(st):
+        return
+    header = {"path": os.path.abspath(filename), "every": index.every, "mtime_ns": st.st_mtime_ns,
+              "size": st.st_size, "lines": index.lines, "scanned": index.scanned, "complete": index.complete}
+    try:
+        fd, temp = tempfile.mkstemp(dir=index_dir(), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(index.offsets.tobytes())
+        os.replace(temp, index_path(st))
+    except OSError:
+        return
+    index.loaded = index.scanned
+    evict_indexes()
+
+
+'''
+evict_indexes:
+keeps the saved line indexes under index_cache_size
+'''
+def evict_indexes():
+    '''
+    removes the least recently used indexes until the rest fit in
+    index_cache_size. opening an index touches it, so its mtime says when
+    it was last used.
+    '''
+    try:
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                   for entry in os.scandir(index_dir()) if entry.name.endswith(".idx")]
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= index_cache_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+'''
+index:
+builds or shows the saved line indexes
+'''
+def index(parts):
+    '''
+    builds the line index of files, so head -n -N, tail -n +N and less can
+    jump straight to a line of them instead of counting from the top.
+    indexes are saved in the cache directory, are thrown away when their
+    file changes, and the least recently used go when they take up too much
+    space.
+
+    flags:
+    -l : list the saved indexes
+    -c : remove all saved indexes
+    '''
+    return run_stream(stream_index, parts)
+
+
+'''
+stream_index:
+streaming version of index
+'''
+def stream_index(parts, lines):
+    '''
+    yields one line per file: its line count, how many offsets the index
+    holds and how big it is on disk.
+    '''
+    options, params = get_options(parts, "lc")
+    if "c" in options:
+        try:
+            for entry in os.scandir(index_dir()):
+                if entry.name.endswith(".idx"):
+                    os.remove(entry.path)
+        except FileNotFoundError:
+            # another shell cleared it first
+            pass
+        except OSError as e:
+            raise CommandError(f"index: cannot clear the saved indexes: {e.strerror}")
+        return
+    if "l" in options:
+        try:
+            entries = sorted(os.scandir(index_dir()), key=lambda entry: entry.name)
+        except OSError as e:
+            raise CommandError(f"index: cannot list the saved indexes: {e.strerror}")
+        for entry in entries:
+            if not entry.name.endswith(".idx"):
+                continue
+            try:
+                size = entry.stat().st_size
+                with open(entry.path, "rb") as f:
+                    header = json.loads(f.readline())
+            except (OSError, ValueError):
+                yield f"{entry.name}: unreadable index"
+                continue
+            if not isinstance(header, dict) or not isinstance(header.get("path"), str):
+                yield f"{entry.name}: unreadable index"
+                continue
+            try:
+                st = os.stat(header["path"])
+                state = "" if [st.st_mtime_ns, st.st_size] == [header.get("mtime_ns"), header.get("size")] else " (stale)"
+            except OSError:
+                state = " (stale)"
+            lines_text = f"{header.get('lines', 0)} lines" if header.get("complete") else f"{header.get('lines', 0)}+ lines"
+            yield f"{header['path']}: {lines_text}, {size} bytes{state}"
+        return
+    if not params:
+        raise CommandError("index: missing file operand")
+
+    for filename in params:
+        try:
+            f = open(filename, "rb")
+        except FileNotFoundError:
+            raise CommandError(f"index: {filename}: No such file or directory")
+        except PermissionError:
+            raise CommandError(f"index: {filename}: Permission denied")
+        except IsADirectoryError:
+            raise CommandError(f"index: {filename}: Is a directory")
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                yield f"{filename}: 0 lines"
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                line_index = open_line_index(filename, data, st)
+                count = line_index.line_count()
+                save_line_index(line_index, filename, st, force=True)
+        yield f"{filename}: {count} lines, {len(line_index.offsets)} offsets (every {line_index.every} lines)"
+
+'''
+head:
+displays the first ten lines of a file
+'''
+def head(parts):
+    '''
+    displays the first ten lines of a file.
+
+    flags:
+    -n N : print the first N lines, or all but the last N with -n -N
+    -c N : print the first N bytes, or all but the last N with -c -N
+
+    with more than one file, each one gets a ==> file <== header. with no
+    file, head prints the start of its piped input.
+
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output dict: {"output":string,"error":string}
+    '''
+    return run_stream(stream_head, parts)
+
 
 '''
-cat:
-allows the user to view the contents of a file
+stream_head:
+streaming version of head used by the pipeline
 '''
-def cat(parts):
+def stream_head(parts, lines):
     '''
-    Displays or cats file contents or piped input, with optional formatting.
+    yields the first n lines of a file or of the piped input, then stops reading.
+    because the pipeline is pulled line by line, stopping here also stops every
+    command upstream of head, and a file is never read past what is printed.
 
-    Flags:
-    -n : number all lines
-    -b : number non-empty lines (overrides -n)
-    -s : collapse multiple blank lines into one
-    -v : display non-printing characters (except tabs and newlines)
-
-    Input: dict with keys: "input" (str), "cmd" (str), "params" (list), "flags" (str)
-    Output: dict with keys: "output" (str), "error" (str)
+    input: the command dict and an iterator of piped lines (or None)
+    output: generator of lines, raises CommandError on a bad file or count
     '''
-    arguments = parts.get("params", [])
-    options = parts.get("flags", "")
-    piped_data = parts.get("input")
-    output_file = parts.get("outfile")
-    append_mode = parts.get("append", False)
+    options, params = get_options(parts, "n:c:")
 
-    # Determine input sources
-    if piped_data is not None:
-        sources = ["<stdin>"]
-    else:
-        sources = arguments
-        if not sources:
-            return {"output": None, "error": "cat: No file provided"}
+    # -c counts bytes, -n (the default) counts lines
+    by_bytes = "c" in options
+    count_text = options.get("c") if by_bytes else options.get("n", "10")
+    try:
+        n = int(count_text)
+    except ValueError:
+        raise CommandError("head: invalid number of bytes" if by_bytes else "head: invalid number of lines")
+
+    # with no file, work on the piped input
+    if not params:
+        if lines is None:
+            raise CommandError("Head: missing file operand")
+        if by_bytes:
+            if n < 0:
+                yield from piped_head_all_but_bytes(lines, -n)
+            else:
+                yield from split_bytes(piped_head_bytes(lines, n))
+        else:
+            yield from first_lines(lines, n)
+        return
 
-    all_lines = []
+    for i, filename in enumerate(params):
+        if len(params) > 1:
+            if i > 0:
+                yield ""
+            yield f"==> {filename} <=="
 
-    # Collect content from all sources
-    for source in sources:
+        # all but the last lines are found with the line index, which reads the file as bytes
+        as_bytes = by_bytes or n < 0
+        # tries to open the file
         try:
-            if source == "<stdin>":
-                all_lines.extend(piped_data.splitlines(keepends=True))
-            else:
-                with open(source, "r", encoding="utf-8") as file:
-                    all_lines.extend(file.readlines())
+            f = open(filename, "rb") if as_bytes else open(filename, "r", encoding="utf-8", errors="replace")
+        # if the file doesn't exist, return an error message
         except FileNotFoundError:
-            return {"output": None, "error": f"cat: {source}: File not found"}
+            raise CommandError(f"head: {filename}: No such file or directory")
+        # if the user doesn't have permission to read the file, return an error message
         except PermissionError:
-            return {"output": None, "error": f"cat: {source}: Access denied"}
-        except Exception as err:
-            return {"output": None, "error": f"cat: Error: {str(err)}"}
-
-    # Apply -s flag: reduce multiple blank lines
-    if "s" in options:
-        filtered_lines = []
-        last_was_blank = False
-        for line in all_lines:
-            is_blank = line.strip() == ""
-            if is_blank and last_was_blank:
-                continue
-            filtered_lines.append(line)
-            last_was_blank = is_blank
-        all_lines = filtered_lines
-
-    # Apply -v flag: show non-printing characters
-    if "v" in options:
-        import string
-        modified_lines = []
-        for line in all_lines:
-            new_line = ""
-            for char in line:
-                if char in string.printable or char in ("\t", "\n"):
-                    new_line += char
+            raise CommandError(f"head: {filename}: Permission denied")
+        except IsADirectoryError:
+            raise CommandError(f"head: error reading '{filename}': Is a directory")
+        with f:
+            if not by_bytes and n >= 0:
+                yield from first_lines(file_lines(f), n)
+            elif not by_bytes:
+                yield from head_all_but(f, filename, -n)
+            elif n >= 0:
+                yield from split_bytes(f.read(n))
+            else:
+                # all but the last -n bytes: the size says where to stop
+                size = os.fstat(f.fileno()).st_size
+                if size > 0:
+                    yield from split_bytes(f.read(max(size + n, 0)))
                 else:
-                    new_line += f"^{chr(ord(char) % 128 + 64)}"
-            modified_lines.append(new_line)
-        all_lines = modified_lines
+                    yield from split_bytes(f.read()[:n])
 
-    # Apply -b or -n flag: add line numbers
-    if "b" in options:
-        numbered_lines = []
-        line_counter = 0
-        for line in all_lines:
-            if line.strip():
-                line_counter += 1
-                numbered_lines.append(f"{line_counter:6}  {line.rstrip()}\n")
-            else:
-                numbered_lines.append(line)
-        all_lines = numbered_lines
-    elif "n" in options:
-        all_lines = [f"{i+1:6}  {line.rstrip()}\n" for i, line in enumerate(all_lines)]
 
-    final_output = "".join(all_lines).rstrip()
+'''
+first_lines:
+takes the first n lines from an iterator of lines
+'''
+def first_lines(lines, n):
+    '''
+    yields the first n lines and stops pulling as soon as it has them. a negative
+    n means everything but the last -n lines; those are held back in a deque
+    that never grows past -n lines, so the input is still streamed.
+    '''
+    if n >= 0:
+        # islice stops reading after n lines, so nothing past them is ever read
+        yield from islice(lines, n)
+        return
+    held = deque()
+    for line in lines:
+        held.append(line)
+        # this line is more than -n lines from the end, so it is printed
+        if len(held) > -n:
+            yield held.popleft()
 
-    # Handle output redirection
-    if output_file:
-        try:
-            mode = "a" if append_mode else "w"
-            with open(output_file, mode, encoding="utf-8") as file:
-                file.write(final_output + "\n")
-            return {"output": None, "error": None}
-        except PermissionError:
-            return {"output": None, "error": f"cat: {output_file}: Access denied"}
-        except Exception as err:
-            return {"output": None, "error": f"cat: Error: {str(err)}"}
 
-    return {"output": final_output, "error": None}
+'''
+head_all_but:
+prints all but the last lines of a file (head -n -N)
+'''
+def head_all_but(f, filename, n):
+    '''
+    yields every line of the open binary file except the last n. the line
+    index counts the lines (or already knows how many there are) and finds
+    where the first line that isn't printed starts, so the lines themselves
+    are only read once, on the way out.
+    '''
+    st = os.fstat(f.fileno())
+    # files like the /proc ones can't be mapped, so they go through the deque
+    if st.st_size == 0 or not f.seekable():
+        yield from first_lines(range_lines(f, 0, 0), -n)
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        line_index = open_line_index(filename, data, st)
+        keep = line_index.line_count() - n
+        end = line_index.line_offset(keep) if keep > 0 else 0
+        save_line_index(line_index, filename, st)
+    if end is None:
+        end = st.st_size
+    if end > 0:
+        yield from range_lines(f, 0, end)
 
 
 '''
-mv:
-moves files/directories to a different location and renames files
+piped_head_bytes:
+takes the first bytes of the piped input
 '''
-def mv(parts):
-    
-    params = parts.get("params") or []
-    if len(params) < 2:
-        return {"output": None, "error": "mv: missing file operand"}
+def piped_head_bytes(lines, n):
+    '''
+    returns the first n bytes of the piped lines, reading no more lines
+    than it needs.
+    '''
+    kept = []
+    total = 0
+    for line in lines:
+        if total >= n:
+            break
+        chunk = (line + "\n").encode("utf-8")
+        kept.append(chunk)
+        total += len(chunk)
+    return b"".join(kept)[:n]
+
+'''
+piped_head_all_but_bytes:
+drops the last bytes of the piped input (head -c -N)
+'''
+def piped_head_all_but_bytes(lines, n):
+    '''
+    yields the piped lines without their last n bytes as they come, holding
+    no more than about n bytes (plus one line) at a time, the way -n -N
+    holds its lines in a deque.
+    '''
+    kept = deque()
+    total = 0
+    for line in lines:
+        chunk = (line + "\n").encode("utf-8")
+        kept.append(chunk)
+        total += len(chunk)
+        # a whole line in front of the last n bytes can go out
+        while kept and total - len(kept[0]) >= n:
+            total -= len(kept[0])
+            yield kept.popleft()[:-1].decode("utf-8")
+    # what is left is no more than n bytes past a line; part of it may go out
+    yield from split_bytes(b"".join(kept)[:max(total - n, 0)])
+
+'''
+tail:
+prints the data at the end of a file
+'''
+def tail(parts):
+    '''
+    prints the data at the end of a file.
+
+    flags:
+    -n N : print the last N lines (10 by default), or from line N on with +N
+    -c N : print the last N bytes, or from byte N on with +N
+    -f : keep printing lines as they are added to the file (ctrl-c stops)
+    -F : like -f, but follows the file name, so it keeps going when the
+         file is rotated, removed and created again, or truncated
+
+    with no file, tail prints the end of its piped input.
+
+    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
+    output dict: {"output":string,"error":string}
+    '''
+    return run_stream(stream_tail, parts)
 
-    src, dest = params[0], params[1]
 
+'''
+stream_tail:
+streaming version of tail used by the pipeline
+'''
+def stream_tail(parts, lines):
+    '''
+    yields the end of a file without reading the whole file: it seeks to the
+    end and reads backwards a block at a time until it has seen enough
+    newlines (see tail_lines), so the cost depends on how much is printed,
+    not on the size of the file. piped input is kept in a deque that only
+    ever holds the last n lines.
+
+    input: the command dict and an iterator of piped lines (or None)
+    output: generator of lines, raises CommandError on a bad file or count
+    '''
+    options, params = get_options(parts, "n:c:fF")
+    by_name = "F" in options
+    follow = by_name or "f" in options
+
+    # -c counts bytes, -n (the default) counts lines
+    by_bytes = "c" in options
+    count_text = options.get("c") if by_bytes else options.get("n", "10")
+    # +N means "start at line (or byte) N" instead of "the last N"
+    from_start = count_text.startswith("+")
     try:
-        # If target is a directory, append the filename
-        if os.path.isdir(dest):
-            dest = os.path.join(dest, os.path.basename(src))
+        # like gnu tail, -n -5 means the same as -n 5
+        n = abs(int(count_text))
+    except ValueError:
+        raise CommandError("tail: invalid number of bytes" if by_bytes else "tail: invalid number of lines")
 
-        shutil.move(src, dest)
-        return {"output": f"Moved '{src}' to '{dest}'", "error": None}
+    # with no file, work on the piped input
+    if not params:
+        if lines is None:
+            raise CommandError("tail: missing the file operand")
+        if by_bytes and from_start:
+            yield from skip_bytes(lines, max(n - 1, 0))
+        elif by_bytes:
+            yield from split_bytes(piped_tail_bytes(lines, n))
+        elif from_start:
+            yield from islice(lines, max(n - 1, 0), None)
+        else:
+            # the deque drops the oldest line each time a new one comes in
+            yield from deque(lines, maxlen=n)
+        return
 
+    # assumes the first parameter is a filename
+    filename = params[0]
+    # tries to open the file
+    try:
+        f = open(filename, "rb")
+    # if the file doesn't exist, return an error message
     except FileNotFoundError:
-        return {"output": None, "error": f"mv: cannot stat '{src}': No such file or directory"}
+        # -F waits for the file to show up
+        if by_name:
+            yield from follow_file(filename, 0, by_name)
+            return
+        raise CommandError(f"tail: cannot open '{filename}': No such file")
+    # if the user doesn't have permission to read the file, return an error message
     except PermissionError:
-        return {"output": None, "error": f"mv: cannot move '{src}': Permission denied"}
-    except Exception as e:
-        return {"output": None, "error": f"mv: {str(e)}"}
+        raise CommandError(f"tail: cannot open '{filename}': Permission denied")
+    except IsADirectoryError:
+        raise CommandError(f"tail: error reading '{filename}': Is a directory")
+
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        # files like the /proc ones say they are empty but aren't, and can't be
+        # read backwards, so they are read forwards into a deque instead
+        seekable = size > 0 and f.seekable()
+
+        if by_bytes:
+            if from_start:
+                f.seek(max(n - 1, 0))
+                data = f.read()
+            elif seekable:
+                f.seek(max(size - n, 0))
+                data = f.read()
+            else:
+                data = f.read()[-n:] if n else b""
+            yield from split_bytes(data)
+            # everything up to here has been printed
+            size = max(size, f.tell())
+        elif from_start and seekable:
+            # the line index finds where line n starts without reading up to it
+            st = os.fstat(f.fileno())
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                line_index = open_line_index(filename, data, st)
+                start = line_index.line_offset(max(n - 1, 0))
+                save_line_index(line_index, filename, st)
+            if start is not None:
+                yield from range_lines(f, start, 0)
+            size = max(size, f.tell())
+        elif from_start:
+            yield from islice(range_lines(f, 0, 0), max(n - 1, 0), None)
+            size = max(size, f.tell())
+        elif seekable:
+            yield from tail_lines(f, size, n)
+        else:
+            yield from deque(range_lines(f, 0, 0), maxlen=n)
 
+    # files that can't be read backwards can't be followed either
+    if follow and seekable:
+        yield from follow_file(filename, size, by_name)
 
 
-'''changes the permissions of a file 
-what the numbers mean in command ex: 777 
-it grants permission access for a file 
-the [0] = owner
-[1] = group
-[2] = others 
-"0": "---", "1": "--x", "2": "-w-", "3": "-wx",
-"4": "r--", "5": "r-x", "6": "rw-", "7": "rwx"
 '''
-def chmod(parts):
+tail_lines:
+reads the last lines of a file backwards from its end
+'''
+def tail_lines(f, size, n, block_size=64 * 1024):
     '''
-    changes the permissions of a file. 
-    
-    [0] = owner
-    [1] = group
-    [2] = others 
-    "0": "---", "1": "--x", "2": "-w-", "3": "-wx",
-    "4": "r--", "5": "r-x", "6": "rw-", "7": "rwx"
+    reads an open binary file backwards in blocks, starting at its end, until
+    it has more than n newlines (or reaches the start of the file), then
+    returns the last n lines. only those blocks are ever read.
     '''
-    params = parts.get("params") or []
-
-    if len(params) < 2:
-        return{"output":None, "error": "chmod:missing operand \n usage: chmod <mode> <filename>"}
-    
+    if n == 0:
+        return []
+    position = size
+    blocks = []
+    newlines = 0
+    # the newline at the very end closes the last line instead of starting a new one
+    f.seek(size - 1)
+    trailing = 1 if f.read(1) == b"\n" else 0
+    while position > 0 and newlines - trailing < n:
+        step = min(block_size, position)
+        position -= step
+        f.seek(position)
+        block = f.read(step)
+        blocks.append(block)
+        newlines += block.count(b"\n")
+    data = b"".join(reversed(blocks))
+    return split_bytes(data)[-n:]
 
-    mode_str, filename = params[0], params[1]
 
+'''
+follow_file:
+prints the lines added to a file as they come in (tail -f / tail -F)
+'''
+def follow_file(filename, position, by_name):
+    '''
+    yields every complete line written to the file after byte `position`,
+    until ctrl-c is pressed (or a threaded pipeline is torn down). it sleeps in
+    a FileWatcher between writes instead of busy looping.
+
+    a file that gets shorter was truncated and is read again from the start.
+    with by_name (-F) the name is checked too: when the file is rotated or
+    removed and created again, the new file is opened and read from its start,
+    and a missing file is waited for.
+    '''
+    watcher = FileWatcher(filename)
+    f = None
+    # the start of a line that hasn't been finished yet
+    partial = b""
     try:
-        #this convert  the strings like "777" into octal int (example 0o777)
+        while True:
+            if f is None:
+                try:
+                    f = open(filename, "rb")
+                    f.seek(position)
+                except FileNotFoundError:
+                    if not by_name:
+                        raise CommandError(f"tail: cannot open '{filename}': No such file")
+                    f = None
+
+            data = f.read(64 * 1024) if f is not None else b""
+            if data:
+                watcher.changed()
+                pieces = (partial + data).split(b"\n")
+                partial = pieces.pop()
+                for piece in pieces:
+                    yield piece.decode("utf-8", errors="replace")
+                continue
 
-        mode = int(mode_str, 8)
+            if f is not None:
+                opened = os.fstat(f.fileno())
+                # the file got shorter than what was read: it was truncated
+                if opened.st_size < f.tell():
+                    f.seek(0)
+                    partial = b""
+                    continue
+                if by_name:
+                    try:
+                        named = os.stat(filename)
+                    except FileNotFoundError:
+                        named = None
+                    # a different file has this name now: it was rotated
+                    if named is not None and (named.st_dev, named.st_ino) != (opened.st_dev, opened.st_ino):
+                        f.close()
+                        f = None
+                        position = 0
+                        partial = b""
+                        continue
+
+            # nothing new, so wait (or stop, if the pipeline is going away)
+            if stage_waiting():
+                return
+            watcher.wait()
+    except KeyboardInterrupt:
+        return
+    finally:
+        watcher.close()
+        if f is not None:
+            f.close()
 
-        os.chmod(filename, mode)
 
-        permissions = stat.filemode(mode)
+'''
+FileWatcher:
+waits until a file might have changed
+'''
+class FileWatcher:
+    '''
+    waits for changes to a file. where the system has inotify, it watches the
+    file's directory through a small ctypes binding (see Inotify), which also
+    catches the file being replaced. everywhere else it polls, starting at
+    follow_poll_min and backing off to follow_poll_max while nothing changes.
+    '''
+    def __init__(self, filename):
+        self.interval = follow_poll_min
+        try:
+            self.inotify = Inotify(os.path.dirname(os.path.abspath(filename)))
+        except OSError:
+            self.inotify = None
+
+    def wait(self):
+        '''
+        returns when there may be something new (or after a while anyway).
+        '''
+        if self.inotify is not None:
+            self.inotify.wait(follow_poll_max)
+        else:
+            sleep(self.interval)
+            self.interval = min(self.interval * 2, follow_poll_max)
 
-        return {"output": f"permission of '{filename}' changed to {mode_str}", "error":None}
+    def changed(self):
+        '''
+        something new was read, so poll quickly again.
+        '''
+        self.interval = follow_poll_min
 
-    except ValueError:
-        return {"ouput":None, "error": f"chmod invalid mode:'{mode_str}'", "error":None}
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
 
-    except FileNotFoundError:
-        return{"output":None, "error":f"chmod: there no such file '{filename}'"}
 
-    except PermissionError:
-        return {"output": None, "error": f"chmod: changing permissions of '{filename}': Permission denied"}
+'''
+Inotify:
+a small ctypes binding to linux's inotify
+'''
+class Inotify:
+    '''
+    watches a directory for files being written, created, moved or removed.
+    raises OSError when inotify isn't available (not linux, or out of watches).
+    '''
+    # event masks from <sys/inotify.h>
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    def __init__(self, directory):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError, TypeError):
+            raise OSError("inotify is not available")
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = (Inotify.IN_MODIFY | Inotify.IN_ATTRIB | Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_FROM
+                | Inotify.IN_MOVED_TO | Inotify.IN_CREATE | Inotify.IN_DELETE)
+        if add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        '''
+        waits up to timeout seconds for an event, then throws away whatever
+        events came in (the caller looks at the file itself).
+        '''
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
 
-    except Exception as e:
-        return {"output": None, "error": f"chmod: {str(e)}"}
 
 '''
-wc
-counts the total number of words/lines in a file or piped input
+split_bytes:
+splits raw bytes into decoded lines
 '''
-def wc(parts):
+def split_bytes(data):
     '''
-    Counts lines, words, bytes, and/or characters in files or piped input.
+    decodes the bytes and splits them into lines without newlines. a newline
+    at the very end doesn't make an extra empty line.
+    '''
+    text = data.decode("utf-8", errors="replace")
+    if text.endswith("\n"):
+        text = text[:-1]
+    return text.split("\n") if text else []
 
-    Flags:
-    -l : count lines
-    -w : count words
-    -c : count bytes
-    -m : count characters (overrides -c if specified)
 
-    Input: dict with keys: {"input" (str), "cmd" (str), "params" (list), "flags" (str)}
-    Output: dict with keys: "output" (str), "error" (str)
+'''
+piped_tail_bytes:
+keeps the last bytes of the piped input
+'''
+def piped_tail_bytes(lines, n):
+    '''
+    returns the last n bytes of the piped lines, holding no more than about
+    n bytes (plus one line) at a time.
     '''
-    arguments = parts.get("params", [])
-    options = parts.get("flags", "")
-    piped_data = parts.get("input")
+    kept = deque()
+    total = 0
+    for line in lines:
+        chunk = (line + "\n").encode("utf-8")
+        kept.append(chunk)
+        total += len(chunk)
+        # drop whole lines from the front while what's left is still enough
+        while kept and total - len(kept[0]) >= n:
+            total -= len(kept.popleft())
+    data = b"".join(kept)
+    return data[-n:] if n else b""
 
-    # Decide what to count based on flags or default behavior
-    show_lines = "l" in options or not options
-    show_words = "w" in options or not options
-    show_bytes = "c" in options or not options
-    show_chars = "m" in options
-    if show_chars and "c" in options:
-        show_bytes = False  # -m takes precedence over -c
 
-    # Determine input sources
-    sources = arguments if arguments else []
-    if piped_data is not None:
-        sources = ["<stdin>"]  # Handle piped input
+'''
+skip_bytes:
+drops the first bytes of the piped input
+'''
+def skip_bytes(lines, skip):
+    '''
+    yields the piped lines from byte `skip` on (tail -c +N).
+    '''
+    for line in lines:
+        chunk = (line + "\n").encode("utf-8")
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        yield chunk[skip:-1].decode("utf-8", errors="replace")
+        skip = 0
 
-    overall_lines = 0
-    overall_words = 0
-    overall_bytes = 0
-    overall_chars = 0
-    results = []
+'''
+grep:
+finds matching words within text files
+'''
+def grep(parts):
+    """
+    Runs a search on a file or through piped input.
 
-    for source in sources:
-        if source == "<stdin>":
-            text_content = piped_data
-        else:
-            try:
-                with open(source, "r", encoding="utf-8") as file:
-                    text_content = file.read()
-            except FileNotFoundError:
-                return {"output": None, "error": f"word_count: {source}: File not found"}
-            except PermissionError:
-                return {"output": None, "error": f"word_count: {source}: Access denied"}
-            except Exception as err:
-                return {"output": None, "error": f"word_count: Error: {str(err)}"}
+    Flags:
+    -i : ignore case
+    -l : list matching filenames only
+    -c : count matching lines
+    -v : select the lines that do NOT match
+    -n : put the line number in front of each line
+    -w : only match whole words
+    -E : the pattern is a (python) regular expression
+    -F : the pattern is a fixed string (the default)
+    -f FILE : read the patterns from FILE, one per line
+    --parallel=N : search big files with N worker processes (default: one per cpu)
+    """
+    return run_stream(stream_grep, parts)
 
-        # Calculate counts
-        line_total = text_content.count("\n") + (1 if text_content and not text_content.endswith("\n") else 0)
-        word_total = len(text_content.split())
-        byte_total = len(text_content.encode("utf-8"))
-        char_total = len(text_content)
 
-        # Accumulate totals for multiple files
-        overall_lines += line_total
-        overall_words += word_total
-        overall_bytes += byte_total
-        overall_chars += char_total
+'''
+stream_grep:
+streaming version of grep used by the pipeline
+'''
+def stream_grep(parts, lines):
+    """
+    Yields matching lines as soon as they are found. Files are searched in
+    parallel worker processes when there is enough data to make it worth it
+    (see grep_files); piped input is searched one line at a time.
 
-        # Build output for this source
-        counts = []
-        if show_lines:
-            counts.append(f"{line_total:8}")
-        if show_words:
-            counts.append(f"{word_total:8}")
-        if show_chars:
-            counts.append(f"{char_total:8}")
-        if show_bytes:
-            counts.append(f"{byte_total:8}")
-        if source != "<stdin>":
-            counts.append(source)
-        results.append(" ".join(counts))
+    Input: the command dict and an iterator of piped lines (or None)
+    Output: generator of lines, raises CommandError on a bad file
+    """
+    options, params = get_options(parts, "ilcvnwEFf:", ["parallel="])
 
-    # Add totals if multiple files
-    if len(sources) > 1:
-        total_counts = []
-        if show_lines:
-            total_counts.append(f"{overall_lines:8}")
-        if show_words:
-            total_counts.append(f"{overall_words:8}")
-        if show_chars:
-            total_counts.append(f"{overall_chars:8}")
-        if show_bytes:
-            total_counts.append(f"{overall_bytes:8}")
-        total_counts.append("total")
-        results.append(" ".join(total_counts))
+    # the patterns come from -f FILE, or else from the first parameter
+    if "f" in options:
+        try:
+            with open(options["f"], "r", encoding="utf-8") as f:
+                patterns = f.read().splitlines()
+        except FileNotFoundError:
+            raise CommandError(f"grep: {options['f']}: No such file")
+        except PermissionError:
+            raise CommandError(f"grep: {options['f']}: Permission denied")
+        files = params
+    else:
+        # throw error
+        if not params:
+            raise CommandError("grep: missing search pattern")
+        patterns = [params[0]]
+        files = params[1:]
+
+    search = {
+        # a tuple, so it can be a key of the compiled pattern cache
+        "patterns": tuple(patterns),
+        "ignore_case": "i" in options,
+        "extended": "E" in options and "F" not in options,
+        "whole_word": "w" in options,
+        "invert": "v" in options,
+        "number": "n" in options,
+    }
+
+    if "l" in options:
+        mode = "list"
+    elif "c" in options:
+        mode = "count"
+    else:
+        mode = "lines"
+
+    try:
+        workers = int(options["parallel"]) if "parallel" in options else os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError
+    except ValueError:
+        raise CommandError(f"grep: invalid number of threads: '{options['parallel']}'")
+
+    # with no patterns at all no line matches, and like GNU grep nothing is shown (not even -c)
+    if not patterns and not search["invert"]:
+        return
+
+    # a bad regex is reported once here instead of inside every worker
+    try:
+        compile_pattern(search["patterns"], search["ignore_case"], search["extended"], search["whole_word"], False)
+    except re.error as e:
+        raise CommandError(f"grep: invalid regular expression: {e}")
+
+    # search in files, if applicable
+    if files:
+        yield from grep_files(files, search, mode, workers)
+
+    # search piped input if no files are given
+    elif lines is not None:
+        results = grep_lines(lines, search, mode)
+        if mode == "list":
+            if any(results):
+                yield "(standard input)"
+        elif mode == "count":
+            yield str(sum(results))
+        else:
+            for number, line in results:
+                yield line if number is None else f"{number}:{line}"
+
+
+'''
+compile_pattern:
+turns grep's patterns into one compiled regex, remembering the result
+'''
+@lru_cache(maxsize=128)
+def compile_pattern(patterns, ignore_case, extended, whole_word, as_bytes):
+    """
+    returns one compiled regex that matches any of the patterns, or None when a
+    single plain substring search is enough. the results are kept in an LRU
+    cache keyed on the patterns and flags, so running the same search again
+    (or re-running it with !x) skips compiling it.
+
+    fixed strings are searched in lowered text for -i (see lower_text), so they
+    are lowered here and several of them are merged into a prefix tree (see
+    trie_regex), which lets the regex engine check hundreds of patterns in a
+    single pass. -E patterns are kept as they are and use re.IGNORECASE.
+    an empty list of patterns (grep -f on an empty file) matches no line.
+    """
+    flags = 0
+    if not patterns:
+        # no patterns match nothing (an empty one would match everything)
+        body = "(?!)"
+    elif extended:
+        body = "|".join(f"(?:{pattern})" for pattern in patterns)
+        if ignore_case:
+            flags = re.IGNORECASE
+    else:
+        words = [pattern.lower() if ignore_case else pattern for pattern in patterns]
+        if len(words) == 1 and not whole_word:
+            return None
+        body = trie_regex(words)
 
-    return {"output": "\n".join(results).strip(), "error": None}
+    if whole_word:
+        # in raw bytes every non-ascii byte is treated as part of a word
+        word = r"[\w\x80-\xff]" if as_bytes else r"\w"
+        body = f"(?<!{word})(?:{body})(?!{word})"
+
+    if as_bytes:
+        # the bytes regex runs over many lines at once, so ^ and $ have to
+        # match at every line
+        return re.compile(body.encode("utf-8"), flags | re.MULTILINE)
+    return re.compile(body, flags)
 
-          
 
 '''
-sort:
-sorts the contents of a file(s) in ASCII order
+trie_regex:
+builds a regex that matches any of a list of fixed strings
 '''
-def sort(parts):
-    '''
-    sorts the contents of a file(s) in ASCII order.
-    '''
-    params = parts.get("params") or []
-    if not params:
-        return{"output":None, "error": "sort:missing file operand"}
-
-    filename = params[0]
+def trie_regex(words):
+    """
+    merges the words into a prefix tree and writes the tree out as a regex, so
+    "cat|car|cart" becomes "ca(?:r(?:t)?|t)". the regex engine then walks the
+    tree once per position instead of trying every word one after another.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        # an empty key marks the end of a word
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # a word ends here, so the rest of the branch is optional
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
 
-    try:
-        with open(filename, "r", encoding ="utf-8") as f:
-            lines = f.readlines()
-            sorted_lines = sorted(line.strip() for line in lines)
-            result ="\n".join(sorted_lines)
-            return {"output": result, "error":None}
-        
-    except FileNotFoundError:
-        return{"output":None, "error":f"sort: {filename}: no such file exists"}
-    except PermissionError:
-        return{"output":None, "error":f"sort:{filename}: permisiion denied"}
 
 '''
-less:
-allows the user to only see snippets of files
+lower_text:
+tells whether grep searches the lowered text
 '''
-def less(parts):
-    '''
-    Shows a file's contents page by page, with optional line count and line numbers.
+def lower_text(search):
+    """
+    fixed string searches with -i lower the text and the patterns; -E
+    searches use re.IGNORECASE on the original text instead.
+    """
+    return search["ignore_case"] and not search["extended"]
 
-    Flags:
-    -N : show line numbers
-    '''
-    params = parts.get("params", [])
-    flags = parts.get("flags", "")
-    show_numbers = "N" in flags
 
-    # Check if any parameters are provided
-    if not params:
-        return {"output": None, "error": "less: No file given"}
+'''
+grep_lines:
+searches an iterator of lines, one at a time
+'''
+def grep_lines(lines, search, mode):
+    """
+    the line by line search used for piped input, -v and searches that can't
+    be done on raw bytes. in "lines" mode it yields (line number, line) pairs
+    (the number is None without -n), in "count" mode it yields the number of
+    selected lines once, and in "list" mode it yields True at the first one.
+    """
+    regex = compile_pattern(search["patterns"], search["ignore_case"], search["extended"], search["whole_word"], False)
+    # only a single pattern is searched for without a regex
+    needle = None
+    if regex is None:
+        needle = search["patterns"][0].lower() if search["ignore_case"] else search["patterns"][0]
+    lower = lower_text(search)
+    invert = search["invert"]
+    number = search["number"]
+
+    count = 0
+    for line_number, line in enumerate(lines, start=1):
+        line_to_check = line.lower() if lower else line
+        if regex is None:
+            found = needle in line_to_check
+        else:
+            found = regex.search(line_to_check) is not None
+
+        # -v selects the lines that don't match
+        if found != invert:
+            if mode == "list":
+                yield True
+                return
+            elif mode == "count":
+                count += 1
+            else:
+                yield (line_number if number else None), line.rstrip()
 
-    # Default to 20 lines per page
-    lines_per_page = 10
-    file_name = None
+    if mode == "count":
+        yield count
 
-    # Find file name and line count
-    for param in params:
-        if param.isdigit():
-            lines_per_page = int(param)  # Set custom line count
-            if lines_per_page <= 0:
-                return {"output": None, "error": "less: Line count must be positive"}
-        else:
-            file_name = param  # Set file name
 
-    if not file_name:
-        return {"output": None, "error": "less: No file given"}
+'''
+grep_files:
+searches a list of files, in parallel when it pays off
+'''
+def grep_files(files, search, mode, workers):
+    """
+    Searches the files in order and yields the output lines ("file:line",
+    "file:count" or just "file" for -l). When there is enough data, the files
+    are cut into newline aligned byte ranges (see grep_tasks) that a process
+    pool searches side by side; the results are put back in the original order.
+    """
+    tasks = grep_tasks(files, workers)
+    total = sum(task["end"] - task["start"] for task in tasks)
+    jobs = [(task["file"], task["start"], task["end"], search, mode)
+            if task["error"] is None else None for task in tasks]
+
+    pool = None
+    if workers > 1 and total >= grep_parallel_min:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = ordered_map(pool, grep_range, jobs, window=workers * 2)
+    else:
+        # one range per file here, so no line count is needed to number lines
+        results = ((grep_range_lines(*job), 0) if job else None for job in jobs)
 
     try:
-        # Read the file
-        with open(file_name, "r", encoding="utf-8") as file:
-            lines = file.readlines()
-
-        # Start at the first line
-        start_line = 0
-
-        # Show file page by page
-        while start_line < len(lines):
-            # Get the next chunk of lines
-            end_line = min(start_line + lines_per_page, len(lines))
-            for i, line in enumerate(lines[start_line:end_line], start=start_line + 1):
-                if show_numbers:
-                    print(f"{i:4} {line.rstrip()}")  # Show line number
-                else:
-                    print(line.rstrip())  # Show line without extra newline
+        count = 0
+        found = False
+        # how many lines of the file came before the current range
+        lines_before = 0
+        for task, result in zip(tasks, results):
+            if task["error"]:
+                raise CommandError(task["error"])
+            if task["start"] == 0:
+                lines_before = 0
+            matches, lines_in_range = result
+            if mode == "lines":
+                for number, line in matches:
+                    if number is None:
+                        yield f"{task['file']}:{line}"
+                    else:
+                        yield f"{task['file']}:{lines_before + number}:{line}"
+            elif mode == "count":
+                count += sum(matches)
+            else:
+                found = found or any(matches)
+            lines_before += lines_in_range
+            # the ranges of a file come one after another, so the file is
+            # finished once its last range is in
+            if task["last"]:
+                if mode == "count":
+                    yield f"{task['file']}:{count}"
+                elif mode == "list" and found:
+                    yield task["file"]
+                count = 0
+                found = False
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
 
-            # Stop if we’ve shown all lines
-            if end_line >= len(lines):
-                break
 
-            # Show prompt and wait for user input
-            sys.stdout.write("--More-- (press space to continue, q to quit)")
-            sys.stdout.flush()
+'''
+grep_tasks:
+splits the files for grep into newline aligned byte ranges
+'''
+def grep_tasks(files, workers):
+    """
+    returns one task dict per byte range: {"file", "start", "end", "last",
+    "error"}. files bigger than grep_chunk_size are cut into at least one range
+    per worker, each ending right after a newline so no line is split. a file
+    that can't be read gets a single task holding its error message, so the
+    error shows up in the right place of the output.
+    """
+    tasks = []
+    for filename in files:
+        try:
+            if os.path.isdir(filename):
+                raise IsADirectoryError
+            with open(filename, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                chunks = 1
+                if workers > 1 and size > grep_chunk_size:
+                    chunks = max(workers, -(-size // grep_chunk_size))
+                bounds = newline_bounds(f, size, chunks)
+        except FileNotFoundError:
+            error = f"grep: {filename}: No such file"
+        except PermissionError:
+            error = f"grep: {filename}: Permission denied"
+        except IsADirectoryError:
+            error = f"grep: {filename}: Is a directory"
+        else:
+            for start, end in zip(bounds, bounds[1:]):
+                tasks.append({"file": filename, "start": start, "end": end, "last": end == size, "error": None})
+            continue
+        tasks.append({"file": filename, "start": 0, "end": 0, "last": True, "error": error})
+    return tasks
 
-            # Use getch to get a single key
-            from getch import Getch
-            key = Getch()()
 
-            # Clear the prompt
-            sys.stdout.write("\r" + " " * 40 + "\r")
-            sys.stdout.flush()
+'''
+newline_bounds:
+cuts a file into byte ranges that end on a newline
+'''
+def newline_bounds(f, size, chunks):
+    """
+    returns the offsets [0, ..., size] that cut an open binary file into about
+    `chunks` equal ranges, with every cut moved forward to just after a newline.
+    """
+    bounds = [0]
+    for i in range(1, chunks):
+        guess = size * i // chunks
+        if guess <= bounds[-1]:
+            continue
+        # read on from the byte before the guess, so a guess that already sits
+        # at the start of a line stays where it is
+        f.seek(guess - 1)
+        f.readline()
+        cut = f.tell()
+        if bounds[-1] < cut < size:
+            bounds.append(cut)
+    bounds.append(size)
+    return bounds
 
-            # Handle user input
-            if key.lower() == "q":
-                return {"output": None, "error": None}
-            if key in (" ", "\r"):
-                start_line += lines_per_page  # Move to next page
-            # Ignore other keys and loop again
 
-        return {"output": None, "error": None}
+'''
+grep_range_lines:
+searches one byte range of a file
+'''
+def grep_range_lines(filename, start, end, search, mode):
+    """
+    searches the lines between byte offsets start and end, giving the same
+    results as grep_lines (line numbers count from the start of the range).
+
+    the file is memory mapped and searched as raw bytes, so only the lines
+    that match are ever decoded (see grep_mapped). -v, and patterns that can't
+    be searched as bytes (non-ascii patterns with -i or -E), are checked line by
+    line instead, as are files that can't be mapped (empty files, or files like
+    the /proc ones that report a size of 0).
+    """
+    ascii_only = all(pattern.isascii() for pattern in search["patterns"])
+    needs_text = (search["ignore_case"] or search["extended"]) and not ascii_only
+    if end <= start or search["invert"] or needs_text:
+        with open(filename, "rb") as f:
+            yield from grep_lines(range_lines(f, start, end), search, mode)
+        return
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from grep_mapped(mm, start, end, search, mode)
 
-    except FileNotFoundError:
-        return {"output": None, "error": f"less: {file_name}: File not found"}
-    except PermissionError:
-        return {"output": None, "error": f"less: {file_name}: Access denied"}
-    except Exception as e:
-        return {"output": None, "error": f"less: Error: {str(e)}"}
-    
 
 '''
-head:
-displays the first ten lines of a file
+grep_mapped:
+searches a memory mapped byte range without decoding it
 '''
-def head(parts):
-    '''
-    displays the first ten lines of a file.
-
-    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
-    output dict: {"output":string,"error":string}
-    '''
-    # if params doesn't exist, defaults to an empty list
-    params = parts.get("params") or []
-    # if flags doesn't exist, defaults to an empty string
-    flags = parts.get("flags") or ""
+def grep_mapped(mm, start, end, search, mode):
+    """
+    jumps from match to match with bytes.find (or the compiled bytes regex),
+    and only then looks for the newlines around a match to cut out its line.
 
-    # if a filename is not provided, return an error message
-    if not params:
-        return {"output": None, "error": "Head: missing file operand"}
-    
-    # assumes the first parameter is a filename
-    filename = params[0]
-    # default number of lines to show
-    n = 10
+    a plain substring search runs straight on the mapped file. otherwise the
+    range is copied a block at a time, lowered in one go for -i (the patterns
+    were lowered once in compile_pattern), so the search stays in C instead of
+    lowering every line in python. -n counts the newlines skipped between matches.
+    """
+    regex = compile_pattern(search["patterns"], search["ignore_case"], search["extended"], search["whole_word"], True)
+    # only a single pattern is searched for without a regex
+    needle = None
+    lower = lower_text(search)
+    if regex is None:
+        needle = search["patterns"][0].encode("utf-8")
+        if lower:
+            needle = needle.lower()
+    number = search["number"]
+
+    count = 0
+    line_number = 0
+    # a plain search needs no copying at all
+    direct = regex is None and not lower and not number
+    if direct:
+        blocks = [(start, end)]
+    else:
+        blocks = mapped_blocks(mm, start, end)
 
-    if "n" in flags:
-        # check that there's at least one more parameter after the filename
-        if len(params) > 1:
-            # tries to convert the second parameter to an integer
-            try:
-                n = int(params[1])
-            # if the second parameter isn't an integer return an error message
-            except ValueError:
-                return {"output": None, "error": "head: invalid number of lines"}
-        # if the user typed head {filename} -n without a number after the n
-        # return an error message
+    for block_start, block_end in blocks:
+        if direct:
+            hay = mm
+            offset, low, high = 0, block_start, block_end
         else:
-            return {"output": None, "error": "head: option requires an argument -- 'n'"}
-    # tries to open the file and read its lines    
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            # reads all lines into a list
-            lines = f.readlines()
-            # returns the first n lines as a single string
-            return {"output": "".join(lines[:n]), "error": None}
-    # if the file doesn't exist, return an error message
-    except FileNotFoundError:
-        return {"output": None, "error": f"head: {filename}: No such file or directory"}
-    # if the user doesn't have permission to read the file, return an error message
-    except PermissionError:
-        return {"output": None, "error": f"head: {filename}: Permission denied"}
-    
-'''
-tail:
-prints the data at the end of a file
-'''
-def tail(parts):
-    '''
-    prints the data at the end of a file.
+            # offsets in the block are relative to block_start
+            hay = mm[block_start:block_end]
+            if lower:
+                hay = hay.lower()
+            offset, low, high = block_start, 0, block_end - block_start
+
+        # pos is always at the start of a line
+        pos = low
+        while pos < high:
+            if regex is None:
+                hit = hay.find(needle, pos, high)
+            else:
+                match = regex.search(hay, pos, high)
+                hit = match.start() if match else -1
+            if hit < 0:
+                break
+            # an empty match right after the last newline isn't on any line
+            if hit == high and hay[high - 1:high] == b"\n":
+                break
+            line_end = hay.find(b"\n", hit, high)
+            if line_end < 0:
+                line_end = high
+            newline = hay.rfind(b"\n", pos, hit)
+            line_start = newline + 1 if newline >= 0 else pos
+
+            # a regex like "a\s+b" can run on into the next line, so the line
+            # is checked again on its own
+            if regex is not None and match.end() > line_end:
+                if regex.search(hay, line_start, line_end) is None:
+                    if number:
+                        line_number += hay.count(b"\n", pos, line_start) + 1
+                    pos = line_end + 1
+                    continue
+
+            if mode == "list":
+                yield True
+                return
+            elif mode == "count":
+                count += 1
+            else:
+                if number:
+                    line_number += hay.count(b"\n", pos, line_start) + 1
+                line = mm[offset + line_start:offset + line_end]
+                yield (line_number if number else None), line.decode("utf-8", errors="replace").rstrip()
+            # carry on from the next line, so a line is only matched once
+            pos = line_end + 1
+        if number:
+            line_number += hay.count(b"\n", pos, high)
 
-    input: dict: {"input":string,"cmd":string,"params":list,"flags":string}
-    output dict: {"output":string,"error":string}
-    '''
-    # if params doesn't exist, defaults to an empty list
-    params = parts.get("params") or []
-    # if flags doesn't exist, defaults to an empty string
-    flags = parts.get("flags") or ""
+    if mode == "count":
+        yield count
 
-    # if a filename is not provided, return an error message
-    if not params:
-        return {"output": None, "error": "tail: missing the file operand"}
-    
-    # assumes the first parameter is a filename
-    filename = params[0]
-    # default number of lines to show
-    n = 10
 
-    # if the user included the "n" flag
-    if "n" in flags:
-        # check that there's at least one more parameter after the filename
-        if len(params) > 1:
-            # tries to convert the second parameter to an integer
-            try:
-                n = int(params[1])
-            # if the second parameter isn't an integer return an error message
-            except ValueError:
-                return {"output": None, "error": "tail: invalid number of lines"}
-        # if the user typed tail {filename} -n without a number after the n
-        # return an error message
-        else:
-            return {"output": None, "error": "tail: option requires an argument -- 'n'"}
-    # tries to open the file and read its lines   
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            # reads all lines into a list
-            lines = f.readlines()
-            # returns the last n lines as a single string
-            return {"output": "".join(lines[-n:]), "error": None}
-    # if the file doesn't exist, return an error message
-    except FileNotFoundError:
-        return {"output": None, "error": f"tail: cannot open '{filename}': No such file"}
-    # if the user doesn't have permission to read the file, return an error message
-    except PermissionError:
-        return {"output": None, "error": f"tail: cannot open '{filename}': Permission denied"}
 '''
-grep:
-finds matching words within text files
+mapped_blocks:
+cuts a memory mapped byte range into newline aligned blocks
 '''
-def grep(parts):
+def mapped_blocks(mm, start, end, block_size=8 * 1024 * 1024):
     """
-    Runs a search on a file or through piped input.
-
-    Flags:
-    -i : ignore case
-    -l : list matching filenames only
+    yields (block_start, block_end) pairs of about block_size bytes covering
+    start to end, each ending right after a newline.
     """
-    params = parts.get("params") or []
-    flags = parts.get("flags") or ""
-    input_text = parts.get("input")
-
-    # throw error
-    if not params:
-        return {"output": None, "error": "grep: missing search pattern"}
+    while start < end:
+        stop = min(start + block_size, end)
+        if stop < end:
+            newline = mm.rfind(b"\n", start, stop)
+            if newline < 0:
+                # a single line longer than the block
+                newline = mm.find(b"\n", stop, end)
+            stop = newline + 1 if newline >= 0 else end
+        yield start, stop
+        start = stop
 
-    to_match = params[0]
-    files = params[1:]
 
-    ignore_case = "i" in flags
-    list_files = "l" in flags
-    count_only = "c" in flags
+'''
+range_lines:
+reads the lines of one byte range of a binary file
+'''
+def range_lines(f, start, end):
+    """
+    yields the decoded lines between byte offsets start and end of an open
+    binary file. a range with end <= start is read to the end of the file.
+    """
+    f.seek(start)
+    position = start
+    for raw in f:
+        if start < end <= position:
+            break
+        position += len(raw)
+        yield raw.decode("utf-8", errors="replace").rstrip("\n")
 
-    lines_match = []
-    files_match = set()
-    count_match = 0
 
-    # search in files, if applicable
-    for filename in files:
-        try:
-            count = 0
-            # open file
-            with open(filename, "r", encoding="utf-8") as f:
-                for line in f:
-                    # check the lines to match the pattern
-                    line_to_check = line
-                    pattern_to_check = to_match
-                    # if "i" in flags
-                    if ignore_case:
-                        line_to_check = line.lower()
-                        pattern_to_check = to_match.lower()
-
-                    if pattern_to_check in line_to_check:
-                        # if "l" in flags
-                        if list_files:
-                            files_match.add(filename)
-                            break
-                            # if "c" in flags
-                        elif count_only:
-                            count += 1
-                        else:
-                            lines_match.append(f"{filename}:{line.rstrip()}")
-            if count_only:
-                lines_match.append(f"{filename}:{count}")
-        except FileNotFoundError:
-            return {"output": None, "error": f"grep: {filename}: No such file"}
-        except PermissionError:
-            return {"output": None, "error": f"grep: {filename}: Permission denied"}
+'''
+grep_range:
+runs grep_range_lines in a worker process
+'''
+def grep_range(job):
+    """
+    the function the process pool runs: searches one byte range and returns
+    its results as a list, so they can be sent back to the shell, along with
+    the number of lines in the range (only counted for -n, to number the lines
+    of the ranges after it).
+    """
+    filename, start, end, search, mode = job
+    matches = list(grep_range_lines(*job))
+    lines_in_range = 0
+    if search["number"] and end > start:
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for block_start, block_end in mapped_blocks(mm, start, end):
+                    lines_in_range += mm[block_start:block_end].count(b"\n")
+    return matches, lines_in_range
 
-    # search piped input if no files are given
-    if not files and input_text:
-        for line in input_text.splitlines():
-            line_to_check = line
-            pattern_to_check = to_match
-            if ignore_case:
-                line_to_check = line.lower()
-                pattern_to_check = to_match.lower()
-
-            if pattern_to_check in line_to_check:
-                if count_only:
-                    count += 1
-                else:
-                    lines_match.append(line.rstrip())
 
-        if count_only:
-            lines_match.append(str(count))
+'''
+ordered_map:
+runs a function over jobs in a pool, returning the results in order
+'''
+def ordered_map(pool, func, jobs, window):
+    """
+    like pool.map, but only keeps `window` jobs in flight at once, so the
+    results of a huge input never pile up in memory. a job of None is skipped
+    and gives None.
+    """
+    pending = deque()
+    jobs = iter(jobs)
+    for job in islice(jobs, window):
+        pending.append(pool.submit(func, job) if job is not None else None)
+    while pending:
+        future = pending.popleft()
+        for job in islice(jobs, 1):
+            pending.append(pool.submit(func, job) if job is not None else None)
+        yield future.result() if future is not None else None
 
-    # display output
-    if list_files:
-        return {"output": "\n".join(files_match), "error": None}
-    else:
-        return {"output": "\n".join(lines_match), "error": None}
 
 '''
 history:
@@ -1077,44 +4938,377 @@ def clear(parts=None):
 piping: 
 handles piping of commands as well as redirects
 '''
-def piping(command_list):
-    prev_output = None  # output from previous command
+def piping(command_list, sink=None, threaded=None, terminal=False):
+    '''
+    runs the parsed commands as a chain of generators. every stage pulls lines
+    from the stage before it only when it needs them, so memory stays flat no
+    matter how big the input is, and a stage that stops early (like head) stops
+    everything upstream of it too.
+
+    input: list of command dicts from parse_cmd, and an optional sink that is
+    called with each output line as soon as it is produced (the prompt uses print).
+    threaded runs every stage in its own thread instead (see threaded_piping);
+    it defaults to the threaded_pipes setting. terminal says the sink prints
+    to the terminal, so output that needs no changes can go there directly.
+    output dict: {"output":string,"error":string}
+    '''
+    if threaded is None:
+        threaded = threaded_pipes
+
+    # a plain cat to a file (or the terminal) never needs to see the lines
+    if len(command_list) == 1 and plain_cat(command_list[0]) and (terminal or command_list[0].get("outfile")):
+        try:
+            copy_cat(command_list[0])
+        except CommandError as e:
+            return {"output": None, "error": str(e)}
+        except (OSError, UnicodeError) as e:
+            return {"output": None, "error": stage_error(e)}
+        return {"output": None, "error": None}
+    # a single command has nothing to overlap with
+    if threaded and len(command_list) > 1:
+        return threaded_piping(command_list, sink)
+
+    lines = None   # output from previous command
+    # the errors the commands report and go on after (see report_error)
+    errors = []
+    outer_errors = getattr(stage_context, "errors", None)
+    stage_context.errors = errors
 
     for cmd_dict in command_list:
         # handle input file
-        if cmd_dict.get("infile"):
+        if cmd_dict.get("infile") and lines is None:
+            lines = infile_lines(cmd_dict)
+
+        # chain this command onto the previous one
+        lines = stream_command(cmd_dict, lines)
+
+        # handle output redirection
+        if cmd_dict.get("outfile"):
+            lines = redirect_lines(cmd_dict, lines)
+
+    # pull the lines through the whole pipeline
+    output = []
+    try:
+        for line in lines:
+            if sink is None:
+                output.append(line)
+            else:
+                sink(line)
+    # if there’s an error, stop the pipe
+    except CommandError as e:
+        return {"output": None, "error": "\n".join(errors + [str(e)])}
+    # a file error a command didn't expect still only stops the pipe
+    except (OSError, UnicodeError) as e:
+        return {"output": None, "error": "\n".join(errors + [stage_error(e)])}
+    # ctrl-c stops the command, not the shell
+    except KeyboardInterrupt:
+        return {"output": None, "error": None}
+    finally:
+        lines.close()
+        stage_context.errors = outer_errors
+
+    if sink is not None or not output:
+        return {"output": None, "error": "\n".join(errors) or None}
+    return {"output": "\n".join(output), "error": "\n".join(errors) or None}
+
+
+'''
+stage_error:
+describes an error that got out of a pipeline stage
+'''
+def stage_error(e):
+    '''
+    returns the message for an OSError or UnicodeError that a command didn't
+    turn into a CommandError itself, like "words.txt: Is a directory".
+    '''
+    if isinstance(e, OSError) and e.strerror:
+        if e.filename is not None:
+            return f"{e.filename}: {e.strerror}"
+        return e.strerror
+    return str(e)
+
+
+'''
+Pipe:
+a bounded queue of line batches between two threaded pipeline stages
+'''
+class Pipe:
+    '''
+    connects two threaded stages the way a unix pipe does. the writer blocks
+    while the queue is full (backpressure), and the reader closes the pipe when
+    it stops early so the writer can give up instead of blocking forever.
+    errors are sent down the pipe and raised again on the reading side.
+    '''
+    # marks the end of the lines
+    END = object()
+
+    def __init__(self, maxsize=None):
+        self.queue = queue.Queue(maxsize or pipe_queue_size)
+        # set by the reader once it doesn't want any more lines
+        self.closed = threading.Event()
+
+    def put(self, item):
+        '''
+        sends a batch of lines (or END, or an exception) to the reader. returns
+        False if the reader has closed the pipe.
+        '''
+        while not self.closed.is_set():
             try:
-                with open(cmd_dict["infile"], "r", encoding="utf-8") as f:
-                    cmd_dict["input"] = f.read()
-            except FileNotFoundError:
-                return {"output": None, "error": f"{cmd_dict['cmd']}: {cmd_dict['infile']}: No such file"}
-            except PermissionError:
-                return {"output": None, "error": f"{cmd_dict['cmd']}: {cmd_dict['infile']}: Permission denied"}
+                self.queue.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def lines(self, on_wait=None):
+        '''
+        yields the lines sent by the writer. on_wait is called right before the
+        reader has to block on an empty queue, so a stage can pass on whatever
+        it has batched up instead of sitting on it.
+        '''
+        # a closed pipe means whoever is reading has already given up
+        while not self.closed.is_set():
+            if on_wait is not None and self.queue.empty():
+                on_wait()
+            try:
+                item = self.queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if item is Pipe.END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield from item
 
-        # pass previous command's output as input
-        if prev_output is not None:
-            cmd_dict["input"] = prev_output
+    def close(self):
+        '''
+        tells the writer to stop.
+        '''
+        self.closed.set()
 
-        # execute the command
-        result = execute_command(cmd_dict)
 
-        # update prev_output for next command
-        prev_output = result.get("output")
+'''
+threaded_piping:
+runs every command of a pipeline in its own thread
+'''
+def threaded_piping(command_list, sink=None):
+    '''
+    runs each stage of the pipeline in a worker thread, connected to the next
+    stage by a bounded Pipe. stages overlap, so a slow stage no longer holds up
+    the ones around it. an error in any stage travels down to the end of the
+    pipe, and a stage that stops early (like head) closes its input pipe, which
+    stops everything upstream of it.
 
-        # handle output redirection
-        if cmd_dict.get("outfile") and result.get("output") is not None:
-            if cmd_dict.get("append"):
-                mode = "a"  
+    input: list of command dicts from parse_cmd and an optional sink
+    output dict: {"output":string,"error":string}
+    '''
+    pipes = [Pipe() for _ in command_list]
+    # the errors the stages report and go on after, shared by all of them
+    errors = []
+    workers = []
+    for i, cmd_dict in enumerate(command_list):
+        in_pipe = pipes[i - 1] if i > 0 else None
+        worker = threading.Thread(target=run_stage, args=(cmd_dict, in_pipe, pipes[i], errors), daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    output = []
+    try:
+        for line in pipes[-1].lines():
+            if sink is None:
+                output.append(line)
             else:
-                mode = "w"
-            with open(cmd_dict["outfile"], mode, encoding="utf-8") as f:
-                f.write(result["output"] + "\n")
+                sink(line)
+    # if there’s an error, stop the pipe
+    except CommandError as e:
+        return {"output": None, "error": "\n".join(errors + [str(e)])}
+    # a file error a command didn't expect still only stops the pipe
+    except (OSError, UnicodeError) as e:
+        return {"output": None, "error": "\n".join(errors + [stage_error(e)])}
+    # ctrl-c stops the command, not the shell
+    except KeyboardInterrupt:
+        return {"output": None, "error": None}
+    finally:
+        # stop every stage that is still running, then wait for them
+        for pipe in pipes:
+            pipe.close()
+        for worker in workers:
+            worker.join()
+
+    if sink is not None or not output:
+        return {"output": None, "error": "\n".join(errors) or None}
+    return {"output": "\n".join(output), "error": "\n".join(errors) or None}
+
+
+'''
+run_stage:
+the body of one threaded pipeline stage
+'''
+def run_stage(cmd_dict, in_pipe, out_pipe, errors):
+    '''
+    pulls lines from in_pipe (or the < file), runs the command on them and
+    pushes its lines into out_pipe in batches. the errors the command
+    reports and goes on after are added to errors.
+    '''
+    batch = []
+
+    def flush():
+        nonlocal batch
+        if batch:
+            out_pipe.put(batch)
+            batch = []
+
+    # lets a stage that waits on something other than its input pipe (like
+    # tail -f) pass on its batch and notice that the pipeline is going away
+    stage_context.on_wait = flush
+    stage_context.stopped = out_pipe.closed
+    stage_context.errors = errors
+
+    lines = None
+    if in_pipe is not None:
+        lines = in_pipe.lines(on_wait=flush)
+    elif cmd_dict.get("infile"):
+        lines = infile_lines(cmd_dict)
+
+    stage = stream_command(cmd_dict, lines)
+    if cmd_dict.get("outfile"):
+        stage = redirect_lines(cmd_dict, stage)
+
+    try:
+        for line in stage:
+            batch.append(line)
+            if len(batch) >= pipe_batch_size:
+                flush()
+            # the reader went away, so there is no point in going on
+            if out_pipe.closed.is_set():
+                return
+        flush()
+        out_pipe.put(Pipe.END)
+    except BaseException as e:
+        out_pipe.put(e)
+    finally:
+        stage.close()
+        # tell the stage before this one that we are done reading
+        if in_pipe is not None:
+            in_pipe.close()
+
+
+'''
+stage_waiting:
+lets a stage that is about to sleep tell the threaded pipeline about it
+'''
+def stage_waiting():
+    '''
+    called by a stage right before it waits for input that doesn't come
+    through a pipe. in a threaded pipeline this passes on the lines batched
+    so far, and returns True once nobody reads the stage's output anymore,
+    which is the stage's cue to stop. outside of one it just returns False.
+    '''
+    on_wait = getattr(stage_context, "on_wait", None)
+    if on_wait is not None:
+        on_wait()
+    stopped = getattr(stage_context, "stopped", None)
+    return stopped is not None and stopped.is_set()
+
+
+'''
+infile_lines:
+reads the file given with < one line at a time
+'''
+def infile_lines(cmd_dict):
+    '''
+    yields the lines of the input redirect file of a command.
+    '''
+    try:
+        f = open(cmd_dict["infile"], "r", encoding="utf-8", errors="replace")
+    except FileNotFoundError:
+        raise CommandError(f"{cmd_dict['cmd']}: {cmd_dict['infile']}: No such file")
+    except PermissionError:
+        raise CommandError(f"{cmd_dict['cmd']}: {cmd_dict['infile']}: Permission denied")
+    except IsADirectoryError:
+        raise CommandError(f"{cmd_dict['cmd']}: {cmd_dict['infile']}: Is a directory")
+    with f:
+        yield from file_lines(f)
+
+
+'''
+redirect_lines:
+writes the lines of a command to the file given with > or >>
+'''
+def redirect_lines(cmd_dict, lines):
+    '''
+    writes every line of a command into its output file as it arrives. like a
+    real shell, nothing is passed on to the next command after a redirect.
+    '''
+    if cmd_dict.get("append"):
+        mode = "a"  
+    else:
+        mode = "w"
+    try:
+        f = open(cmd_dict["outfile"], mode, encoding="utf-8")
+    except PermissionError:
+        raise CommandError(f"{cmd_dict['cmd']}: {cmd_dict['outfile']}: Permission denied")
+    except OSError as e:
+        raise CommandError(f"{cmd_dict['cmd']}: {cmd_dict['outfile']}: {e.strerror}")
+    with f:
+        for line in lines:
+            f.write(line + "\n")
+    yield from ()
+
+
+'''
+stream_command:
+runs one command of a pipeline as a generator of lines
+'''
+def stream_command(command_dict, lines):
+    '''
+    runs one stage of a pipeline. commands in stream_map work line by line on the
+    lines coming from upstream; every other command goes through adapt_command.
+
+    input: the command dict and an iterator of piped lines (or None)
+    output: generator of lines
+    '''
+    stream_map = {
+        # commands that can work one line at a time
+        'cat': stream_cat,
+        'grep': stream_grep,
+        'head': stream_head,
+        'sort': stream_sort,
+        'tail': stream_tail,
+        'wc': stream_wc,
+        'less': stream_less,
+        'index': stream_index,
+        'ls': stream_ls,
+        'find': stream_find,
+        'du': stream_du,
+    }
+
+    cmd_name = (command_dict.get('cmd') or '').lower()
+    if cmd_name in stream_map:
+        return stream_map[cmd_name](command_dict, lines)
+    return adapt_command(command_dict, lines)
+
+
+'''
+adapt_command:
+lets the dictionary-returning commands take part in the streaming pipeline
+'''
+def adapt_command(command_dict, lines):
+    '''
+    joins the piped lines into the "input" string the older commands expect,
+    runs the command through execute_command, and splits its output back into lines.
+    '''
+    # pass previous command's output as input
+    if lines is not None:
+        command_dict["input"] = "\n".join(lines)
+
+    # execute the command
+    result = execute_command(command_dict)
 
-        # if there’s an error, stop the pipe
-        if result.get("error"):
-            return result
-    # display result
-    return result
+    if result.get("error"):
+        raise CommandError(result["error"])
+    if result.get("output"):
+        yield from result["output"].splitlines()
 
 
 '''
@@ -1148,7 +5342,10 @@ def execute_command(command_dict):
         'grep': grep,
         'help': help,
         'clear': clear,
-        'chmod': chmod
+        'chmod': chmod,
+        'index': index,
+        'find': find,
+        'du': du
         # etc.ex
     }
 
@@ -1279,7 +5476,10 @@ if __name__ == "__main__":
                 command_list = parse_cmd(user_input)
                 if command_list:
                     # execute the command(s)
-                    result = piping(command_list)
+                    result = piping(command_list, sink=print, terminal=True)
+                    # chmod or > onto a file already there don't change a directory's mtime
+                    if any(c["cmd"] in file_changing_commands or c["outfile"] for c in command_list):
+                        dir_cache.clear()
                     # print the output and error (if any)
                     if result["output"]:
                         print(result["output"])